@@ -1,16 +1,16 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from sqlalchemy import func
+from sqlalchemy import Select, bindparam, func, select
 from datetime import datetime, date
 from pathlib import Path
 import socket
+import textwrap
 import uuid
 import os
 import sys
-import json
 from astropy.coordinates import SkyCoord
-from astropy.units import deg, hourangle
+from astropy.units import deg
 
 from database import SessionLocal, FitsFile
 
@@ -21,57 +21,274 @@ st.set_page_config(
     layout="wide",
 )
 
+# Number of rows fetched per round-trip when streaming the sky plot coordinates from the server
+RESULT_CHUNK_SIZE = 50_000
+
+# Number of result rows fetched and displayed per page
+RESULT_PAGE_SIZE = 500
+
+# Columns selected for the results; header_dump is fetched on demand
+RESULT_COLUMNS = [
+    FitsFile.filepath, FitsFile.filename, FitsFile.object_name, FitsFile.date_obs, FitsFile.exptime,
+    FitsFile.altitude, FitsFile.observatory, FitsFile.client_hostname, FitsFile.client_mac,
+]
+
+# Columns needed for the sky plot, which covers every match rather than one page
+COORD_COLUMNS = [FitsFile.object_name, FitsFile.observatory, FitsFile.date_obs, FitsFile.ra_deg, FitsFile.dec_deg]
+
 # --- Helper Functions & Data Loading ---
 
 @st.cache_resource
 def get_db_session():
     return SessionLocal()
 
-@st.cache_data
-def get_client_info() -> dict:
+# (hostname, MAC address) of this machine; uuid.getnode() caches the MAC after the first call
+try:
+    CURRENT_CLIENT = (socket.gethostname(), ':'.join(textwrap.wrap(f'{uuid.getnode():012x}', 2)))
+except Exception:
+    CURRENT_CLIENT = ('unknown', '00:00:00:00:00:00')
+
+@st.cache_data(ttl=60, max_entries=16)
+def get_all_clients(current_mac: str, current_hostname: str) -> dict:
+    """Maps the MAC address of every indexed client, plus this machine, to its hostname."""
+    # Plain DB-API cursor: the distinct scan does not need ORM row objects
+    conn = get_db_session().bind.raw_connection()
     try:
-        mac_int = uuid.getnode()
-        mac_address = ':'.join(f'{mac_int:012x}'[i:i+2] for i in range(0, 12, 2))
-        return {'hostname': socket.gethostname(), 'mac': mac_address}
-    except Exception:
-        return {'hostname': 'unknown', 'mac': '00:00:00:00:00:00'}
-
-@st.cache_data
-def get_all_clients(_db_session_id):
-    db = get_db_session()
-    clients = db.query(FitsFile.client_hostname, FitsFile.client_mac).distinct().all()
-    return {mac: hostname for hostname, mac in clients if mac}
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT client_hostname, client_mac FROM fits_files WHERE client_mac IS NOT NULL")
+        clients = cur.fetchall()
+    finally:
+        conn.close()
+    clients_map = {mac: hostname for hostname, mac in clients if mac}
+    clients_map.setdefault(current_mac, current_hostname)
+    return clients_map
 
 db = get_db_session()
-current_client = get_client_info()
-all_clients_map = get_all_clients(id(db))
-if current_client['mac'] not in all_clients_map:
-    all_clients_map[current_client['mac']] = current_client['hostname']
+all_clients_map = get_all_clients(CURRENT_CLIENT[1], CURRENT_CLIENT[0])
 
-@st.cache_data
-def get_date_range(_db_session_id):
+@st.cache_data(ttl=60, max_entries=16)
+def get_date_range() -> tuple[date, date]:
+    db = get_db_session()
     min_date_db, max_date_db = db.query(func.min(FitsFile.date_obs), func.max(FitsFile.date_obs)).first()
     return min_date_db or date.today(), max_date_db or date.today()
 
-default_min_date, default_max_date = get_date_range(id(db))
+default_min_date, default_max_date = get_date_range()
 
 # --- State Management ---
 
-@st.cache_data
-def get_filter_options(_db_session_id, selected_clients_macs):
+@st.cache_data(ttl=60, max_entries=16)
+def get_filter_options(selected_clients_macs: tuple[str, ...]) -> tuple[list, list, list]:
     """Queries the DB for distinct, sorted lists of filter options."""
-    db = get_db_session()
-    query = db.query(FitsFile)
-    if selected_clients_macs:
-        query = query.filter(FitsFile.client_mac.in_(selected_clients_macs))
-
-    # Query for distinct, non-null, non-empty values and sort them
-    object_names = sorted([r[0] for r in query.with_entities(FitsFile.object_name).distinct().all() if r[0] and r[0] != 'Unknown'])
-    observatories = sorted([r[0] for r in query.with_entities(FitsFile.observatory).distinct().all() if r[0] and r[0] != 'Unknown'])
-    exptimes = sorted([r[0] for r in query.with_entities(FitsFile.exptime).distinct().all() if r[0] is not None])
-    
+    client_clause = " AND client_mac = ANY(%(macs)s)" if selected_clients_macs else ""
+    # One round-trip for all three lists: each branch is tagged with the list it belongs to
+    sql = (
+        "SELECT 'o' AS k, object_name AS v, NULL::float8 AS n FROM fits_files"
+        f" WHERE object_name <> '' AND object_name <> 'Unknown'{client_clause} GROUP BY object_name"
+        " UNION ALL SELECT 'b', observatory, NULL FROM fits_files"
+        f" WHERE observatory <> '' AND observatory <> 'Unknown'{client_clause} GROUP BY observatory"
+        " UNION ALL SELECT 'e', NULL, exptime FROM fits_files"
+        f" WHERE exptime IS NOT NULL{client_clause} GROUP BY exptime"
+        " ORDER BY k, v, n"
+    )
+
+    conn = get_db_session().bind.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, {'macs': list(selected_clients_macs)})
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    # Rows arrive sorted by the database; partition them in a single pass
+    object_names, observatories, exptimes = [], [], []
+    for k, v, n in rows:
+        if k == 'o':
+            object_names.append(v)
+        elif k == 'b':
+            observatories.append(v)
+        else:
+            exptimes.append(n)
+
     return object_names, observatories, exptimes
 
+# WHERE clause for each sidebar filter, with bound parameters so a statement can be
+# compiled once per combination of active filters and reused for any values
+FILTER_CLAUSES = {
+    'object_click_filter': FitsFile.object_name == bindparam('object_click_filter'),
+    'clients': FitsFile.client_mac.in_(bindparam('clients', expanding=True)),
+    'object_names': FitsFile.object_name.in_(bindparam('object_names', expanding=True)),
+    'observatories': FitsFile.observatory.in_(bindparam('observatories', expanding=True)),
+    'exptimes': FitsFile.exptime.in_(bindparam('exptimes', expanding=True)),
+    'altitude': FitsFile.altitude.between(bindparam('min_altitude'), bindparam('max_altitude')),
+    'date_range': FitsFile.date_obs.between(bindparam('start_datetime'), bindparam('end_datetime')),
+}
+
+def build_filters(clients, object_names, observatories, exptimes, min_altitude, max_altitude,
+                  start_datetime, end_datetime, object_click_filter) -> tuple[tuple[str, ...], dict]:
+    """Translates the sidebar state into the names of the active FILTER_CLAUSES and their parameters."""
+    active, params = [], {}
+    # Handle click-to-filter for object
+    if object_click_filter is not None:
+        active.append('object_click_filter')
+        params['object_click_filter'] = object_click_filter
+    if clients:
+        active.append('clients')
+        params['clients'] = list(clients)
+    if object_names:
+        active.append('object_names')
+        params['object_names'] = list(object_names)
+    if observatories:
+        active.append('observatories')
+        params['observatories'] = list(observatories)
+    if exptimes:
+        active.append('exptimes')
+        params['exptimes'] = list(exptimes)
+    if min_altitude > 0 or max_altitude < 90:
+        active.append('altitude')
+        params.update(min_altitude=min_altitude, max_altitude=max_altitude)
+    if start_datetime is not None and end_datetime is not None:
+        active.append('date_range')
+        params.update(start_datetime=start_datetime, end_datetime=end_datetime)
+    return tuple(active), params
+
+# Cached as a resource: the script, and a plain function cache with it, is re-executed on every rerun
+@st.cache_resource(max_entries=128)
+def build_results_statements(active_filters: tuple[str, ...]) -> tuple[Select, Select]:
+    """Builds the count and paged results statements for one combination of active filters."""
+    filters = [FILTER_CLAUSES[name] for name in active_filters]
+    count_stmt = select(func.count()).select_from(FitsFile).where(*filters)
+    page_stmt = (
+        select(*RESULT_COLUMNS).where(*filters)
+        .order_by(FitsFile.date_obs.desc(), FitsFile.id)
+        .limit(RESULT_PAGE_SIZE).offset(bindparam('offset'))
+    )
+    return count_stmt, page_stmt
+
+def compute_statistics(active_filters: tuple[str, ...], params: dict) -> dict:
+    """Computes the statistics panel data with SQL aggregates over the filtered rows."""
+    db = get_db_session()
+    filters = [FILTER_CLAUSES[name] for name in active_filters]
+    # --- Calculations for all metrics ---
+    # All aggregates run in the database against the same filters and
+    # only return one row per group.
+    night = func.date(FitsFile.date_obs)
+    total_exposure_seconds, total_nights = db.execute(
+        select(
+            func.coalesce(func.sum(FitsFile.exptime), 0).label('exposure'),
+            func.count(func.distinct(night)).label('nights'),
+        ).where(*filters),
+        params,
+    ).one()
+
+    today_tz_unaware = datetime.now()
+
+    # Define time ranges for top metrics
+    last_full_month_end = today_tz_unaware.replace(day=1, hour=0, minute=0, second=0, microsecond=0) - pd.Timedelta(days=1)
+    last_full_month_start = last_full_month_end.replace(day=1)
+    comparison_month_start = last_full_month_start - pd.DateOffset(years=1)
+    comparison_month_end = last_full_month_end - pd.DateOffset(years=1)
+
+    # Data for table and observatory chart
+    file_count = func.count().label('count')
+    distinct_objects_df = pd.read_sql(
+        select(FitsFile.object_name, file_count)
+        .where(*filters, FitsFile.object_name.isnot(None))
+        .group_by(FitsFile.object_name).order_by(file_count.desc()),
+        db.bind,
+        params=params,
+    )
+    distinct_objects_df.columns = ['Object Name', 'File Count']
+    observatory_name = func.coalesce(FitsFile.observatory, 'Unknown').label('observatory')
+    observatory_df = pd.read_sql(
+        select(observatory_name, file_count).where(*filters).group_by(observatory_name).order_by(file_count.desc()),
+        db.bind,
+        params=params,
+    )
+
+    # --- Monthly Charts Calculation ---
+    month = func.date_trunc('month', FitsFile.date_obs).label('month')
+    monthly_df = pd.read_sql(
+        select(
+            month,
+            func.count().label('fits_count'),
+            func.coalesce(func.sum(FitsFile.exptime), 0).label('exptime_sum'),
+            func.count(func.distinct(night)).label('nights'),
+        )
+        .where(*filters, FitsFile.date_obs.isnot(None))
+        .group_by(month).order_by(month),
+        db.bind,
+        params=params,
+        index_col='month',
+    )
+    if not monthly_df.empty:
+        # Fill months without data with zeros by reindexing onto the full month range
+        all_months_range = pd.date_range(start=monthly_df.index.min(), end=monthly_df.index.max(), freq='MS')
+        monthly_df = monthly_df.reindex(all_months_range, fill_value=0).rename_axis('month')
+
+        fits_df = monthly_df['fits_count'].reset_index()
+        exposure_df = (monthly_df['exptime_sum'] / 3600).round(1).rename('exposure_hours').reset_index()
+
+        # Calculate comparison metrics for top row by slicing the sorted month index
+        last_month = monthly_df.loc[last_full_month_start:last_full_month_end]
+        comp_month = monthly_df.loc[comparison_month_start:comparison_month_end]
+        nights_last_month, exp_last_month = int(last_month['nights'].sum()), last_month['exptime_sum'].sum()
+        nights_comp_month, exp_comp_month = int(comp_month['nights'].sum()), comp_month['exptime_sum'].sum()
+    else:
+        fits_df = pd.DataFrame({'month': [], 'fits_count': []})
+        exposure_df = pd.DataFrame({'month': [], 'exposure_hours': []})
+        nights_last_month = exp_last_month = nights_comp_month = exp_comp_month = 0
+    delta_nights = nights_last_month - nights_comp_month
+    delta_exp = exp_last_month - exp_comp_month
+
+    # The sky plot needs every match with coordinates, so stream just those columns in chunks: with the
+    # server-side cursor the driver holds one chunk of rows at a time instead of the whole result.
+    # The chunks are Arrow-backed, so concat joins them without copying (each column becomes a chunked
+    # array over the chunks' buffers) and the coordinates are held once, as they stream in.
+    # read_sql yields one empty frame for an empty result, so concat always gets a frame.
+    coords_query = select(*COORD_COLUMNS).where(*filters, FitsFile.ra_deg.isnot(None), FitsFile.dec_deg.isnot(None))
+    with db.bind.connect().execution_options(stream_results=True, max_row_buffer=RESULT_CHUNK_SIZE) as conn:
+        chunks = pd.read_sql(coords_query, conn, params=params, chunksize=RESULT_CHUNK_SIZE, dtype_backend='pyarrow')
+        coords_df = pd.concat(chunks, ignore_index=True)
+
+    return {
+        'total_exposure_seconds': total_exposure_seconds,
+        'total_nights': total_nights,
+        'last_full_month_start': last_full_month_start,
+        'nights_last_month': nights_last_month,
+        'delta_nights': delta_nights,
+        'exp_last_month': exp_last_month,
+        'delta_exp': delta_exp,
+        'distinct_objects_df': distinct_objects_df,
+        'observatory_df': observatory_df,
+        'fits_df': fits_df,
+        'exposure_df': exposure_df,
+        'coords_df': coords_df,
+    }
+
+@st.cache_data(ttl=300, max_entries=32)
+def load_results(clients: tuple, object_names: tuple, observatories: tuple, exptimes: tuple,
+                 min_altitude: int, max_altitude: int, start_datetime: datetime | None,
+                 end_datetime: datetime | None, object_click_filter: str | None,
+                 page: int) -> tuple[pd.DataFrame, int]:
+    """Runs the search for one filter state and returns one page of results and the total match count."""
+    db = get_db_session()
+    active_filters, params = build_filters(clients, object_names, observatories, exptimes, min_altitude,
+                                           max_altitude, start_datetime, end_datetime, object_click_filter)
+    count_stmt, page_stmt = build_results_statements(active_filters)
+    total_count = db.scalar(count_stmt, params)
+
+    # Arrow-backed columns so strings are not materialised as Python objects
+    df = pd.read_sql(page_stmt, db.bind, params={**params, 'offset': page * RESULT_PAGE_SIZE}, dtype_backend='pyarrow')
+    return df, total_count
+
+@st.cache_data(ttl=300, max_entries=32)
+def load_statistics(clients: tuple, object_names: tuple, observatories: tuple, exptimes: tuple,
+                    min_altitude: int, max_altitude: int, start_datetime: datetime | None,
+                    end_datetime: datetime | None, object_click_filter: str | None) -> dict:
+    """Computes the statistics for one filter state; cached separately so paging does not recompute them."""
+    return compute_statistics(*build_filters(clients, object_names, observatories, exptimes, min_altitude,
+                                             max_altitude, start_datetime, end_datetime, object_click_filter))
+
 # --- State Management ---
 
 def initialize_state():
@@ -90,6 +307,7 @@ def initialize_state():
         st.session_state.selected_clients = [] # No client selected by default
     if 'object_click_filter' not in st.session_state: 
         st.session_state.object_click_filter = None
+    if 'page' not in st.session_state: st.session_state.page = 0
 
 def clear_all_filters():
     """Resets all filters to their default values."""
@@ -102,6 +320,7 @@ def clear_all_filters():
     st.session_state.selected_file = None
     st.session_state.selected_clients = [] # No client selected by default
     st.session_state.object_click_filter = None
+    st.session_state.page = 0
     # Dataframe selections are cleared automatically on rerun
 
 initialize_state()
@@ -123,7 +342,7 @@ with st.sidebar:
     )
 
     # Get filter options based on selected clients
-    object_opts, obs_opts, exptime_opts = get_filter_options(id(db), st.session_state.selected_clients)
+    object_opts, obs_opts, exptime_opts = get_filter_options(tuple(st.session_state.selected_clients))
 
     st.multiselect(
         "Object Names", 
@@ -144,63 +363,12 @@ with st.sidebar:
 
 # --- Main Content ---
 
-# Base query
-query = db.query(FitsFile)
-
-# Handle click-to-filter for object
-if is_object_filtered_by_click:
-    query = query.filter(FitsFile.object_name == st.session_state.object_click_filter)
-
-# Apply filters from sidebar
-if st.session_state.selected_clients:
-    query = query.filter(FitsFile.client_mac.in_(st.session_state.selected_clients))
-if st.session_state.object_names and not is_object_filtered_by_click: # Only apply if not click-filtered
-    query = query.filter(FitsFile.object_name.in_(st.session_state.object_names))
-if st.session_state.observatories:
-    query = query.filter(FitsFile.observatory.in_(st.session_state.observatories))
-if st.session_state.exptimes:
-    query = query.filter(FitsFile.exptime.in_(st.session_state.exptimes))
-if st.session_state.min_altitude > 0 or st.session_state.max_altitude < 90:
-    query = query.filter(FitsFile.altitude.between(st.session_state.min_altitude, st.session_state.max_altitude))
+# Date range boundaries; the filter is skipped while the range is incomplete
+start_datetime = end_datetime = None
 if len(st.session_state.date_range) == 2:
     start_date, end_date = st.session_state.date_range
     start_datetime = datetime.combine(start_date, datetime.min.time())
     end_datetime = datetime.combine(end_date, datetime.max.time())
-    query = query.filter(FitsFile.date_obs.between(start_datetime, end_datetime))
-
-def extract_coords(header_dump):
-    """Extracts RA/DEC from FITS header dump and converts to decimal degrees."""
-    try:
-        header = header_dump
-        # The header_dump from the DB can be a dict, or a JSON string,
-        # sometimes even a double-encoded JSON string.
-        if isinstance(header, str):
-            try:
-                header = json.loads(header)
-            except json.JSONDecodeError:
-                # If it's not valid JSON, we can't parse it.
-                return None, None
-        
-        # If the result of the first load is *still* a string, it was double-encoded.
-        if isinstance(header, str):
-            try:
-                header = json.loads(header)
-            except json.JSONDecodeError:
-                return None, None
-
-        if not isinstance(header, dict):
-            # We must have a dictionary to proceed
-            return None, None
-
-        ra_str = header.get('RA') or header.get('OBJCTRA')
-        dec_str = header.get('DEC') or header.get('OBJCTDEC')
-
-        if ra_str and dec_str:
-            coords = SkyCoord(ra_str, dec_str, unit=(hourangle, deg))
-            return coords.ra.deg, coords.dec.deg
-    except (ValueError, TypeError): # Catch other potential errors
-        pass
-    return None, None
 
 try:
     # Display filter state if active
@@ -213,91 +381,55 @@ try:
                 st.session_state.object_click_filter = None
                 st.rerun()
 
-    df = pd.read_sql(query.statement, query.session.bind)
-    st.info(f"Found **{len(df)}** matching files from **{len(st.session_state.selected_clients)}** selected client(s).")
-    
-    # Extract coordinates for the sky plot
-    if not df.empty:
-        df[['ra_deg', 'dec_deg']] = df['header_dump'].apply(extract_coords).apply(pd.Series)
-        df_coords = df.dropna(subset=['ra_deg', 'dec_deg']).copy()
+    # The object multiselect is only passed when it is active, keeping the cache key stable
+    filter_args = (
+        tuple(st.session_state.selected_clients),
+        () if is_object_filtered_by_click else tuple(st.session_state.object_names),
+        tuple(st.session_state.observatories),
+        tuple(st.session_state.exptimes),
+        st.session_state.min_altitude,
+        st.session_state.max_altitude,
+        start_datetime,
+        end_datetime,
+        st.session_state.object_click_filter,
+    )
+    # A new search, i.e. any filter change, starts on its first page
+    if st.session_state.get('page_filters') != filter_args:
+        st.session_state.page_filters = filter_args
+        st.session_state.page = 0
+    page = st.session_state.page
+    df, total_count = load_results(*filter_args, page)
+    last_page = max(total_count - 1, 0) // RESULT_PAGE_SIZE
+    if page > last_page:
+        # The filters shrank the match set below the current page; fall back to its last page
+        page = st.session_state.page = last_page
+        df, total_count = load_results(*filter_args, page)
+    stats = load_statistics(*filter_args) if total_count else None
+    st.info(f"Found **{total_count}** matching files from **{len(st.session_state.selected_clients)}** selected client(s).")
 
     # --- Statistics Section ---
-    if not df.empty:
+    if stats is not None:
         with st.expander("Show Statistics for Search Results", expanded=True):
-            # --- Calculations for all metrics ---
-            total_exposure_seconds = df['exptime'].sum()
-            total_nights = pd.to_datetime(df['date_obs']).dt.date.nunique()
-
-            df_date_aware = df.copy()
-            df_date_aware['date_obs_dt'] = pd.to_datetime(df['date_obs']).dt.tz_localize(None)
-            today_tz_unaware = datetime.now()
-
-            # Define time ranges for top metrics
-            last_full_month_end = today_tz_unaware.replace(day=1, hour=0, minute=0, second=0, microsecond=0) - pd.Timedelta(days=1)
-            last_full_month_start = last_full_month_end.replace(day=1)
-            comparison_month_start = last_full_month_start - pd.DateOffset(years=1)
-            comparison_month_end = last_full_month_end - pd.DateOffset(years=1)
-
-            # Calculate comparison metrics for top row
-            nights_last_month = df_date_aware[(df_date_aware['date_obs_dt'] >= last_full_month_start) & (df_date_aware['date_obs_dt'] <= last_full_month_end)]['date_obs_dt'].dt.date.nunique()
-            nights_comp_month = df_date_aware[(df_date_aware['date_obs_dt'] >= comparison_month_start) & (df_date_aware['date_obs_dt'] <= comparison_month_end)]['date_obs_dt'].dt.date.nunique()
-            delta_nights = nights_last_month - nights_comp_month
-
-            exp_last_month = df_date_aware[(df_date_aware['date_obs_dt'] >= last_full_month_start) & (df_date_aware['date_obs_dt'] <= last_full_month_end)]['exptime'].sum()
-            exp_comp_month = df_date_aware[(df_date_aware['date_obs_dt'] >= comparison_month_start) & (df_date_aware['date_obs_dt'] <= comparison_month_end)]['exptime'].sum()
-            delta_exp = exp_last_month - exp_comp_month
-            
-            
-            # Data for table and observatory chart
-            distinct_objects_df = df['object_name'].value_counts().reset_index()
-            distinct_objects_df.columns = ['Object Name', 'File Count']
-            observatory_counts = df['observatory'].fillna('Unknown').value_counts()
-
-            # --- Monthly Charts Calculation ---
-            if not df_date_aware.empty:
-                df_date_aware['month'] = df_date_aware['date_obs_dt'].dt.to_period('M').dt.to_timestamp()
-                
-                # FITS count per month
-                fits_by_month = df_date_aware.groupby('month').size().reset_index(name='fits_count')
-                
-                # Exposure time per month
-                exposure_by_month = (df_date_aware.groupby('month')['exptime'].sum() / 3600).round(1).reset_index(name='exposure_hours')
-                
-                # Determine the full month range from the filtered data and fill gaps
-                min_month = df_date_aware['month'].min()
-                max_month = df_date_aware['month'].max()
-                all_months_range = pd.date_range(start=min_month, end=max_month, freq='MS')
-                all_months_df = pd.DataFrame({'month': all_months_range})
-                
-                fits_df = pd.merge(all_months_df, fits_by_month, on='month', how='left').fillna(0)
-                fits_df['fits_count'] = fits_df['fits_count'].astype(int)
-                
-                exposure_df = pd.merge(all_months_df, exposure_by_month, on='month', how='left').fillna(0)
-            else:
-                fits_df = pd.DataFrame({'month': [], 'fits_count': []})
-                exposure_df = pd.DataFrame({'month': [], 'exposure_hours': []})
-
-
             # --- UI Layout ---
             col1, col2, col3, col4, col5 = st.columns(5)
             with col1:
-                st.metric("Total Distinct Objects", len(distinct_objects_df))
+                st.metric("Total Distinct Objects", len(stats['distinct_objects_df']))
             with col2:
-                st.metric("Total Exposure Time", f"{total_exposure_seconds / 3600:.1f} h")
+                st.metric("Total Exposure Time", f"{stats['total_exposure_seconds'] / 3600:.1f} h")
             with col3:
-                st.metric("Total Nights", total_nights)
+                st.metric("Total Nights", stats['total_nights'])
             with col4:
-                st.metric(f"Nights ({last_full_month_start.strftime('%b %Y')})", value=nights_last_month, delta=f"{delta_nights} vs prior year")
+                st.metric(f"Nights ({stats['last_full_month_start'].strftime('%b %Y')})", value=stats['nights_last_month'], delta=f"{stats['delta_nights']} vs prior year")
             with col5:
-                st.metric(f"Exposure ({last_full_month_start.strftime('%b %Y')}) [h]", value=f"{exp_last_month / 3600:.1f}", delta=f"{(delta_exp / 3600):.1f}h vs prior year")
+                st.metric(f"Exposure ({stats['last_full_month_start'].strftime('%b %Y')}) [h]", value=f"{stats['exp_last_month'] / 3600:.1f}", delta=f"{(stats['delta_exp'] / 3600):.1f}h vs prior year")
 
             st.divider()
 
             chart_col1, chart_col2, chart_col3 = st.columns(3)
             with chart_col1:
                 st.markdown("###### FITS files per month")
-                if not fits_df.empty:
-                    chart = alt.Chart(fits_df).mark_bar().encode(
+                if not stats['fits_df'].empty:
+                    chart = alt.Chart(stats['fits_df']).mark_bar().encode(
                         x=alt.X('month:T', axis=alt.Axis(title=None, format='%b%y')),
                         y=alt.Y('fits_count:Q', axis=alt.Axis(title='Count'))
                     ).properties(height=200)
@@ -307,8 +439,8 @@ try:
             
             with chart_col2:
                 st.markdown("###### Total Exposure Time per Month (h)")
-                if not exposure_df.empty:
-                    chart = alt.Chart(exposure_df).mark_bar().encode(
+                if not stats['exposure_df'].empty:
+                    chart = alt.Chart(stats['exposure_df']).mark_bar().encode(
                         x=alt.X('month:T', axis=alt.Axis(title=None, format='%b%y')),
                         y=alt.Y('exposure_hours:Q', axis=alt.Axis(title='Hours'))
                     ).properties(height=200)
@@ -318,10 +450,8 @@ try:
 
             with chart_col3:
                 st.markdown("###### FITS files per observatory")
-                if not observatory_counts.empty:
-                    observatory_df = observatory_counts.reset_index()
-                    observatory_df.columns = ['observatory', 'count']
-                    chart = alt.Chart(observatory_df).mark_bar().encode(
+                if not stats['observatory_df'].empty:
+                    chart = alt.Chart(stats['observatory_df']).mark_bar().encode(
                         x=alt.X('observatory:N', sort='-y', axis=alt.Axis(title=None, labelAngle=0)),
                         y=alt.Y('count:Q', axis=alt.Axis(title='Count'))
                     ).properties(height=200)
@@ -333,7 +463,8 @@ try:
 
             # --- Celestial Coordinates Scatter Plot ---
             st.markdown("###### Milky Way Structure (Galactic Coordinates)")
-            if 'df_coords' in locals() and not df_coords.empty:
+            df_coords = stats['coords_df'].copy()
+            if not df_coords.empty:
                 # --- Coordinate Transformation ---
                 def get_galactic_coords(row):
                     try:
@@ -379,29 +510,37 @@ try:
                 st.info("No valid celestial coordinates found in the current search results to display the sky plot.")
             
             with st.expander("Objects found in current search"):
-                st.dataframe(distinct_objects_df, use_container_width=True)
+                st.dataframe(stats['distinct_objects_df'], use_container_width=True)
 
 
     if not df.empty:
         st.header("Search Results")
         st.write("Click on a row in the table below to select a file.")
+        st.number_input(
+            f"Page (0–{last_page}, {RESULT_PAGE_SIZE} files per page, newest first)",
+            min_value=0, max_value=last_page, key='page',
+        )
         display_columns = ["filename", "object_name", "date_obs", "exptime", "altitude", "observatory", "client_hostname"]
-        
-        df_display = df[display_columns].copy()
-        df_display['date_obs'] = pd.to_datetime(df_display['date_obs']).dt.strftime('%d.%m.%Y %H:%M:%S')
-        df_display['exptime'] = df_display['exptime'].map('{:,.1f}s'.format)
-        df_display['altitude'] = df_display['altitude'].map('{:.2f}°'.format) if df['altitude'].notna().any() else 'N/A'
-        
+
+        # Numbers and dates are sent unformatted; the browser formats them via column_config
         st.dataframe(
-            df_display, use_container_width=True, hide_index=True,
+            df[display_columns], use_container_width=True, hide_index=True,
+            column_config={
+                'date_obs': st.column_config.DatetimeColumn(format="DD.MM.YYYY HH:mm:ss"),
+                'exptime': st.column_config.NumberColumn(format="%.1fs"),
+                'altitude': st.column_config.NumberColumn(format="%.2f°"),
+            },
             on_select="rerun", selection_mode="single-row", key="results_df"
         )
         
         # --- Handle row selection for filtering ---
         selection = st.session_state.get("results_df", {}).get("selection", {})
+        selected_row = None
         if selection and selection.get("rows"):
             selected_row_index = selection["rows"][0]
-            selected_object_name = df.iloc[selected_row_index]['object_name']
+            # Read the needed cells once as a plain dict instead of building a row Series per access
+            selected_row = {col: df[col].iat[selected_row_index] for col in ('filepath', 'filename', 'object_name')}
+            selected_object_name = selected_row['object_name']
             
             # If the user selected a new object, update the filter and rerun
             if st.session_state.object_click_filter != selected_object_name:
@@ -409,12 +548,9 @@ try:
                 st.rerun()
 
         # --- File Opener Section ---
-        selection = st.session_state.get("results_df", {}).get("selection", {})
-        if selection and selection.get("rows"):
-            selected_row_index = selection["rows"][0]
-            # Use .iloc on the original dataframe `df` to get the real data
-            filepath_to_open = df.iloc[selected_row_index]['filepath']
-            filename_to_open = df.iloc[selected_row_index]['filename']
+        if selected_row is not None:
+            filepath_to_open = selected_row['filepath']
+            filename_to_open = selected_row['filename']
             
             st.divider()
             col1, col2 = st.columns([3, 1])
@@ -439,8 +575,9 @@ try:
         # --- Header Inspector ---
         st.header("FITS Header Inspector")
         file_options = df['filepath'].tolist()
-        # Ensure the selected file is valid, otherwise reset it
-        if st.session_state.selected_file not in file_options:
+        # Ensure the selected file is still part of the results, otherwise reset it.
+        # Compare on the column instead of scanning the Python list on every rerun.
+        if st.session_state.selected_file is not None and not (df['filepath'] == st.session_state.selected_file).any():
             st.session_state.selected_file = None
 
         st.selectbox(
@@ -452,7 +589,9 @@ try:
         )
         
         if st.session_state.selected_file:
-            header_data = df[df['filepath'] == st.session_state.selected_file]['header_dump'].iloc[0]
+            header_data = db.execute(
+                select(FitsFile.header_dump).where(FitsFile.filepath == st.session_state.selected_file)
+            ).scalar()
             st.json(header_data)
         else:
             st.write("Select a file from the list above to see its header.")
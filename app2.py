@@ -1,14 +1,19 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
+import numpy as np
 from datetime import datetime, date
 from pathlib import Path
 import os
 import sys
 import json
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from astropy.coordinates import SkyCoord
 from astropy.units import deg, hourangle
 
+from fitsdb import count_nights, decode_header
+
 # --- Page Configuration ---
 st.set_page_config(
     page_title="FITS File Visualizer",
@@ -16,18 +21,111 @@ st.set_page_config(
     layout="wide",
 )
 
+PARQUET_PATH = "fits_data.parquet"
+# Arrow IPC copy of the catalog without header_dump, preferred by load_data when present
+FEATHER_PATH = "fits_data.feather"
+
+# Parquet metadata entry with the precomputed filter options (see export_data.py)
+FILTER_OPTIONS_KEY = "fitsdb.filter_options"
+
+# Columns loaded as pandas categoricals; export_data.py already writes them dictionary-encoded
+CATEGORY_COLUMNS = ['object_name', 'observatory', 'client_hostname', 'client_mac']
+
+# Object names that are not real targets; left out of the filter options and the sky plot
+PLACEHOLDER_OBJECT_NAMES = ['Unknown', 'flatwizard']
+
+# Columns encoded by the galactic sky plot (see SKY_PLOT_SPEC); only these are serialized to the browser
+SKY_PLOT_COLUMNS = ['object_name', 'observatory', 'l_wrapped', 'galactic_b', 'date_obs']
+
+# Vega-Lite specs for the statistics charts. They do not depend on the data, so they are
+# plain constants; st.vega_lite_chart copies a spec before adjusting it.
+FITS_PER_MONTH_SPEC = {
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "month", "type": "temporal", "axis": {"title": None, "format": "%b %Y"}},
+        "y": {"field": "fits_count", "type": "quantitative", "axis": {"title": "Count"}},
+    },
+    "height": 200,
+}
+
+EXPOSURE_PER_MONTH_SPEC = {
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "month", "type": "temporal", "axis": {"title": None, "format": "%b %Y"}},
+        "y": {"field": "exposure_hours", "type": "quantitative", "axis": {"title": "Hours"}},
+    },
+    "height": 200,
+}
+
+OBSERVATORY_SPEC = {
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "observatory", "type": "nominal", "sort": "-y", "axis": {"title": None, "labelAngle": 0}},
+        "y": {"field": "count", "type": "quantitative", "axis": {"title": "Count"}},
+    },
+    "height": 200,
+}
+
+SKY_PLOT_SPEC = {
+    "mark": {"type": "circle", "size": 10},
+    "params": [
+        # Clicking an observatory in the legend highlights its points
+        {"name": "legend_selection", "select": {"type": "point", "fields": ["observatory"]}, "bind": "legend"},
+        # Pan and zoom
+        {"name": "zoom", "select": "interval", "bind": "scales"},
+    ],
+    "encoding": {
+        "x": {"field": "l_wrapped", "type": "quantitative", "scale": {"domain": [180, -180]}, "axis": {"title": "Galactic Longitude (l) [deg]"}},
+        "y": {"field": "galactic_b", "type": "quantitative", "scale": {"domain": [-90, 90]}, "axis": {"title": "Galactic Latitude (b) [deg]"}},
+        "color": {"field": "observatory", "type": "nominal", "legend": {"title": "Observatory"}},
+        "opacity": {"condition": {"param": "legend_selection", "value": 0.7}, "value": 0.1},
+        "tooltip": [
+            {"field": "object_name", "type": "nominal"},
+            {"field": "observatory", "type": "nominal"},
+            {"field": "l_wrapped", "type": "quantitative"},
+            {"field": "galactic_b", "type": "quantitative"},
+            {"field": "date_obs", "type": "temporal"},
+        ],
+    },
+    "height": 400,
+}
+
 # --- Helper Functions & Data Loading ---
 
 @st.cache_data
 def load_data():
-    """Loads data from the Parquet file and caches it."""
+    """Loads every column except header_dump from the Feather or Parquet file and caches it."""
     try:
-        # Load data from the specified parquet file
-        df = pd.read_parquet("fits_data.parquet")
+        if os.path.exists(FEATHER_PATH):
+            # Arrow IPC copy written by export_data.py; memory-mapped and uncompressed, so reading it
+            # decodes nothing and the numeric columns stay backed by the OS page cache
+            table = pa.ipc.open_file(pa.memory_map(FEATHER_PATH, 'r')).read_all()
+        else:
+            # header_dump is by far the largest column and only needed by the inspector, see load_header
+            columns = [name for name in pq.read_schema(PARQUET_PATH).names if name != 'header_dump']
+            table = pq.read_table(PARQUET_PATH, columns=columns)
+        # One block per column, so numeric columns convert without copying
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
         # Ensure date_obs is a datetime object, coercing errors
         df['date_obs'] = pd.to_datetime(df['date_obs'], errors='coerce')
         # Drop rows where date_obs could not be parsed
         df.dropna(subset=['date_obs'], inplace=True)
+        # filter_rows slices date ranges by binary search; files from older exports are not sorted yet
+        if not df['date_obs'].is_monotonic_increasing:
+            df.sort_values('date_obs', kind='stable', inplace=True)
+        # Low-cardinality columns as categoricals so isin/== compare integer codes, not strings
+        for col in CATEGORY_COLUMNS:
+            df[col] = df[col].astype('category')
+        # Files exported before export_data.py precomputed the galactic coordinates get them here, once
+        if 'galactic_l' not in df.columns:
+            galactic = SkyCoord(
+                ra=df['ra_deg'].to_numpy(dtype='float64') * deg,
+                dec=df['dec_deg'].to_numpy(dtype='float64') * deg,
+                frame='icrs',
+            ).galactic
+            df['galactic_l'] = galactic.l.deg
+            df['galactic_b'] = galactic.b.deg
+            df['l_wrapped'] = (df['galactic_l'] + 180) % 360 - 180
         return df
     except FileNotFoundError:
         st.error("Error: 'fits_data.parquet' not found. Make sure the Parquet file is in the same directory as the app.")
@@ -36,6 +134,60 @@ def load_data():
         st.error(f"An error occurred while loading the Parquet file: {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def get_dataset():
+    """Opens the Parquet file as a pyarrow dataset, keeping its row-group statistics."""
+    return ds.dataset(PARQUET_PATH, format='parquet')
+
+@st.cache_data(max_entries=64)
+def load_header(filepath, date_obs):
+    """Reads the header_dump of a single file from the Parquet file as a dict (a raw string if an older export's JSON is invalid)."""
+    dataset = get_dataset()
+    predicate = ds.field('filepath') == filepath
+    # The file is sorted by date_obs, so row groups whose date statistics exclude date_obs are skipped.
+    # Older exports may not store date_obs as a timestamp; those are searched by filepath alone
+    if pa.types.is_timestamp(dataset.schema.field('date_obs').type):
+        predicate = (ds.field('date_obs') == pa.scalar(date_obs)) & predicate
+    table = dataset.to_table(columns=['header_dump'], filter=predicate)
+    if not table.num_rows:
+        return None
+    header = table.column('header_dump')[0].as_py()
+    if isinstance(header, list):
+        # Typed cards written by export_data.py (fitsdb.HEADER_TYPE)
+        return decode_header(header)
+    # Older exports store the header as a JSON string, possibly encoded twice
+    try:
+        while isinstance(header, str):
+            header = json.loads(header)
+    except json.JSONDecodeError:
+        # A header that is not JSON, shown as the raw string
+        pass
+    return header
+
+@st.fragment
+def header_inspector(file_options, file_dates):
+    """Renders the file selectbox and header; picking another file reruns only this fragment."""
+    st.selectbox(
+        "Select a file to view its header:",
+        options=file_options,
+        key='selected_file',
+        format_func=lambda x: Path(x).name if x else "...",
+        index=file_options.index(st.session_state.selected_file) if st.session_state.selected_file in file_options else 0
+    )
+
+    if st.session_state.selected_file:
+        file_date = file_dates[file_options.index(st.session_state.selected_file)]
+        header_data = load_header(st.session_state.selected_file, file_date)
+        if isinstance(header_data, dict):
+            st.json(header_data, expanded=False)
+        elif header_data is None:
+            st.info("No header is stored for this file.")
+        else:
+            # Not a JSON object, just show the raw value
+            st.text(header_data)
+    else:
+        st.info("Select a file to see its header.")
+
 # Load the main dataframe
 df_main = load_data()
 
@@ -47,11 +199,18 @@ if df_main.empty:
 # --- Get Filter Options from DataFrame ---
 @st.cache_data
 def get_filter_options_from_df(_df):
-    """Gets distinct, sorted lists of filter options from the main DataFrame."""
+    """Gets distinct, sorted lists of filter options from the Parquet metadata or the main DataFrame."""
     if _df.empty:
         return [], [], [], date.today(), date.today()
-        
-    object_names = sorted([name for name in _df['object_name'].unique() if name and name not in ['Unknown', 'flatwizard']])
+
+    # Files written by export_data.py carry the options precomputed in their metadata
+    metadata = pq.read_schema(PARQUET_PATH).metadata or {}
+    if FILTER_OPTIONS_KEY.encode() in metadata:
+        options = json.loads(metadata[FILTER_OPTIONS_KEY.encode()])
+        return (options['object_names'], options['observatories'], options['exptimes'],
+                date.fromisoformat(options['min_date']), date.fromisoformat(options['max_date']))
+
+    object_names = sorted([name for name in _df['object_name'].unique() if name and name not in PLACEHOLDER_OBJECT_NAMES])
     observatories = sorted([obs for obs in _df['observatory'].unique() if obs and obs != 'Unknown'])
     exptimes = sorted([et for et in _df['exptime'].unique() if et is not None])
     min_date = _df['date_obs'].min().date()
@@ -60,6 +219,103 @@ def get_filter_options_from_df(_df):
 
 object_opts, obs_opts, exptime_opts, default_min_date, default_max_date = get_filter_options_from_df(df_main)
 
+@st.cache_data
+def get_selectivity_stats(_df):
+    """Value frequencies and sorted values used to estimate the fraction of rows a filter keeps."""
+    frequencies = {col: _df[col].value_counts(normalize=True) for col in ['object_name', 'observatory', 'exptime']}
+    sorted_values = {col: np.sort(_df[col].dropna().to_numpy()) for col in ['altitude']}
+    return frequencies, sorted_values
+
+value_frequencies, sorted_values = get_selectivity_stats(df_main)
+
+def estimate_isin(col, values):
+    """Fraction of df_main rows whose `col` is one of `values`."""
+    frequencies = value_frequencies[col]
+    return frequencies[frequencies.index.isin(values)].sum()
+
+def estimate_range(col, low, high):
+    """Fraction of df_main rows whose `col` lies in [low, high]."""
+    values = sorted_values[col]
+    return (np.searchsorted(values, high, side='right') - np.searchsorted(values, low, side='left')) / len(df_main)
+
+@st.cache_data(max_entries=32)
+def filter_rows(object_click_filter, object_names, observatories, exptimes, min_altitude, max_altitude, date_range):
+    """Returns the positions in df_main of the rows matching the filters."""
+    # Each active filter is a (selectivity estimate, column, predicate) triple
+    predicates = []
+    # Handle click-to-filter for object
+    if object_click_filter is not None:
+        predicates.append((estimate_isin('object_name', [object_click_filter]), 'object_name', lambda s: s == object_click_filter))
+    if object_names:
+        predicates.append((estimate_isin('object_name', object_names), 'object_name', lambda s: s.isin(object_names)))
+    if observatories:
+        predicates.append((estimate_isin('observatory', observatories), 'observatory', lambda s: s.isin(observatories)))
+    if exptimes:
+        predicates.append((estimate_isin('exptime', exptimes), 'exptime', lambda s: s.isin(exptimes)))
+    if min_altitude > 0 or max_altitude < 90:
+        predicates.append((estimate_range('altitude', min_altitude, max_altitude), 'altitude', lambda s: s.between(min_altitude, max_altitude)))
+
+    rows = np.arange(len(df_main))
+    if len(date_range) == 2:
+        start_date, end_date = date_range
+        start_datetime = pd.to_datetime(start_date).to_datetime64()
+        end_datetime = (pd.to_datetime(end_date) + pd.Timedelta(days=1)).to_datetime64()
+        # df_main is sorted by date_obs, so the date range is one contiguous slice found by binary search
+        dates = df_main['date_obs'].to_numpy()
+        rows = rows[np.searchsorted(dates, start_datetime, side='left'):np.searchsorted(dates, end_datetime, side='right')]
+
+    # Most selective filter first; each later one only tests the rows still matching
+    for _, col, predicate in sorted(predicates, key=lambda p: p[0]):
+        rows = rows[predicate(df_main[col].iloc[rows]).to_numpy()]
+    return rows
+
+@st.cache_data(max_entries=32)
+def compute_statistics(*filter_args) -> dict:
+    """Computes the statistics panel data for the rows matching the filters."""
+    df = df_main.iloc[filter_rows(*filter_args)]
+    # --- Monthly Charts Calculation ---
+    # Month of each row truncated at the numpy level, used directly as the groupby key
+    month = df['date_obs'].to_numpy().astype('datetime64[M]').astype('datetime64[ns]')
+
+    # FITS count and exposure time per month in a single groupby pass
+    monthly = df.groupby(month).agg(fits_count=('exptime', 'size'), exptime_sum=('exptime', 'sum')).rename_axis('month')
+
+    # --- Calculations for all metrics ---
+    # Every row falls in exactly one month, so the total is the sum of the monthly sums
+    total_exposure_seconds = monthly['exptime_sum'].sum()
+    total_nights = count_nights(df['date_obs'].to_numpy())
+
+    # Data for table and observatory chart
+    # value_counts on a categorical also lists the categories absent from the filtered rows
+    object_counts = df['object_name'].value_counts()
+    distinct_objects_df = object_counts[object_counts > 0].reset_index()
+    distinct_objects_df.columns = ['Object Name', 'File Count']
+    observatory_counts = df['observatory'].value_counts(dropna=False)
+    observatory_counts = observatory_counts[observatory_counts > 0]
+    observatory_counts = observatory_counts.groupby(observatory_counts.index.fillna('Unknown'), sort=False).sum()
+    observatory_df = observatory_counts.reset_index()
+    observatory_df.columns = ['observatory', 'count']
+
+    # Determine the full month range from the filtered data and fill gaps
+    if not monthly.empty:
+        # The groupby index is sorted, so reindexing onto the dense month range fills the gaps
+        all_months_range = pd.date_range(start=monthly.index[0], end=monthly.index[-1], freq='MS')
+        monthly = monthly.reindex(all_months_range, fill_value=0).rename_axis('month')
+
+        fits_df = monthly['fits_count'].reset_index()
+        exposure_df = (monthly['exptime_sum'] / 3600).round(1).rename('exposure_hours').reset_index()
+    else:
+        fits_df = pd.DataFrame({'month': [], 'fits_count': []})
+        exposure_df = pd.DataFrame({'month': [], 'exposure_hours': []})
+
+    return {
+        'total_exposure_seconds': total_exposure_seconds,
+        'total_nights': total_nights,
+        'distinct_objects_df': distinct_objects_df,
+        'observatory_df': observatory_df,
+        'fits_df': fits_df,
+        'exposure_df': exposure_df,
+    }
 
 # --- State Management ---
 
@@ -117,26 +373,17 @@ with st.sidebar:
 
 # --- Main Content: Filtering the DataFrame ---
 
-df = df_main.copy()
-
-# Handle click-to-filter for object
-if is_object_filtered_by_click:
-    df = df[df['object_name'] == st.session_state.object_click_filter]
-
-# Apply filters from sidebar
-if st.session_state.object_names and not is_object_filtered_by_click:
-    df = df[df['object_name'].isin(st.session_state.object_names)]
-if st.session_state.observatories:
-    df = df[df['observatory'].isin(st.session_state.observatories)]
-if st.session_state.exptimes:
-    df = df[df['exptime'].isin(st.session_state.exptimes)]
-if st.session_state.min_altitude > 0 or st.session_state.max_altitude < 90:
-    df = df[df['altitude'].between(st.session_state.min_altitude, st.session_state.max_altitude)]
-if len(st.session_state.date_range) == 2:
-    start_date, end_date = st.session_state.date_range
-    start_datetime = pd.to_datetime(start_date)
-    end_datetime = pd.to_datetime(end_date) + pd.Timedelta(days=1)
-    df = df[df['date_obs'].between(start_datetime, end_datetime)]
+# The object multiselect is only passed when it is active, keeping the cache key stable
+filter_args = (
+    st.session_state.object_click_filter,
+    () if is_object_filtered_by_click else tuple(st.session_state.object_names),
+    tuple(st.session_state.observatories),
+    tuple(st.session_state.exptimes),
+    st.session_state.min_altitude,
+    st.session_state.max_altitude,
+    tuple(st.session_state.date_range),
+)
+df = df_main.iloc[filter_rows(*filter_args)]
 
 
 try:
@@ -154,90 +401,45 @@ try:
     
     # Create a DataFrame for the sky plot from the filtered results
     if not df.empty:
-        # The new columns ra_deg and dec_deg are already loaded.
-        # We just need to drop rows where the coordinates are missing.
-        df_coords = df.dropna(subset=['ra_deg', 'dec_deg']).copy()
+        # Galactic coordinates are precomputed per file; only the plotted columns are
+        # copied, dropping rows without coordinates
+        df_coords = df[SKY_PLOT_COLUMNS].dropna(subset=['l_wrapped', 'galactic_b'])
 
     # --- Statistics Section ---
     if not df.empty:
         with st.expander("Show Statistics for Search Results", expanded=True):
-            # --- Calculations for all metrics ---
-            total_exposure_seconds = df['exptime'].sum()
-            total_nights = df['date_obs'].dt.date.nunique()
-            
-            # Data for table and observatory chart
-            distinct_objects_df = df['object_name'].value_counts().reset_index()
-            distinct_objects_df.columns = ['Object Name', 'File Count']
-            observatory_counts = df['observatory'].fillna('Unknown').value_counts()
-
-            # --- Monthly Charts Calculation ---
-            df_date_aware = df.copy()
-            df_date_aware['month'] = df_date_aware['date_obs'].dt.to_period('M').dt.to_timestamp()
-            
-            # FITS count per month
-            fits_by_month = df_date_aware.groupby('month').size().reset_index(name='fits_count')
-            
-            # Exposure time per month
-            exposure_by_month = (df_date_aware.groupby('month')['exptime'].sum() / 3600).round(1).reset_index(name='exposure_hours')
-            
-            # Determine the full month range from the filtered data and fill gaps
-            if not df_date_aware.empty:
-                min_month, max_month = df_date_aware['month'].min(), df_date_aware['month'].max()
-                all_months_range = pd.date_range(start=min_month, end=max_month, freq='MS')
-                all_months_df = pd.DataFrame({'month': all_months_range})
-                
-                fits_df = pd.merge(all_months_df, fits_by_month, on='month', how='left').fillna(0)
-                fits_df['fits_count'] = fits_df['fits_count'].astype(int)
-                
-                exposure_df = pd.merge(all_months_df, exposure_by_month, on='month', how='left').fillna(0)
-            else:
-                fits_df = pd.DataFrame({'month': [], 'fits_count': []})
-                exposure_df = pd.DataFrame({'month': [], 'exposure_hours': []})
+            stats = compute_statistics(*filter_args)
 
             # --- UI Layout for Stats ---
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total Distinct Objects", len(distinct_objects_df))
+                st.metric("Total Distinct Objects", len(stats['distinct_objects_df']))
             with col2:
-                st.metric("Total Exposure Time", f"{total_exposure_seconds / 3600:.1f} h")
+                st.metric("Total Exposure Time", f"{stats['total_exposure_seconds'] / 3600:.1f} h")
             with col3:
-                st.metric("Total Nights", total_nights)
+                st.metric("Total Nights", stats['total_nights'])
 
             st.divider()
 
             chart_col1, chart_col2, chart_col3 = st.columns(3)
             with chart_col1:
                 st.markdown("###### FITS files per month")
-                if not fits_df.empty:
-                    chart = alt.Chart(fits_df).mark_bar().encode(
-                        x=alt.X('month:T', axis=alt.Axis(title=None, format='%b %Y')),
-                        y=alt.Y('fits_count:Q', axis=alt.Axis(title='Count'))
-                    ).properties(height=200)
-                    st.altair_chart(chart, use_container_width=True)
+                if not stats['fits_df'].empty:
+                    st.vega_lite_chart(stats['fits_df'], FITS_PER_MONTH_SPEC, use_container_width=True)
                 else:
                     st.caption("No data for this period.")
             
             with chart_col2:
                 st.markdown("###### Total Exposure Time per Month (h)")
-                if not exposure_df.empty:
-                    chart = alt.Chart(exposure_df).mark_bar().encode(
-                        x=alt.X('month:T', axis=alt.Axis(title=None, format='%b %Y')),
-                        y=alt.Y('exposure_hours:Q', axis=alt.Axis(title='Hours'))
-                    ).properties(height=200)
-                    st.altair_chart(chart, use_container_width=True)
+                if not stats['exposure_df'].empty:
+                    st.vega_lite_chart(stats['exposure_df'], EXPOSURE_PER_MONTH_SPEC, use_container_width=True)
                 else:
                     st.caption("No data for this period.")
 
             with chart_col3:
                 st.markdown("###### FITS files per observatory")
-                if not observatory_counts.empty:
-                    observatory_df = observatory_counts.reset_index()
-                    observatory_df.columns = ['observatory', 'count']
-                    chart = alt.Chart(observatory_df).mark_bar().encode(
-                        x=alt.X('observatory:N', sort='-y', axis=alt.Axis(title=None, labelAngle=0)),
-                        y=alt.Y('count:Q', axis=alt.Axis(title='Count'))
-                    ).properties(height=200)
-                    st.altair_chart(chart, use_container_width=True)
+                if not stats['observatory_df'].empty:
+                    st.vega_lite_chart(stats['observatory_df'], OBSERVATORY_SPEC, use_container_width=True)
                 else:
                     st.caption("No observatory data.")
 
@@ -245,62 +447,33 @@ try:
 
             # --- Celestial Coordinates Scatter Plot ---
             st.markdown("###### Milky Way Structure (Galactic Coordinates)")
-            if 'df_coords' in locals() and not df_coords.empty:
-                # --- Coordinate Transformation ---
-                def get_galactic_coords(row):
-                    try:
-                        coord = SkyCoord(ra=row['ra_deg']*deg, dec=row['dec_deg']*deg, frame='icrs')
-                        return coord.galactic.l.deg, coord.galactic.b.deg
-                    except Exception:
-                        return None, None
-                
-                df_coords[['galactic_l', 'galactic_b']] = df_coords.apply(get_galactic_coords, axis=1, result_type='expand')
-                df_coords.dropna(subset=['galactic_l', 'galactic_b'], inplace=True)
-
-                if not df_coords.empty:
-                    legend_selection = alt.selection_multi(fields=['observatory'], bind='legend')
-
-                    df_filtered_chart = df_coords[
-                        ~df_coords['object_name'].isin(['Unknown', 'flatwizard']) &
-                        df_coords['object_name'].notna()
-                    ]
-
-                    df_galactic_chart = df_filtered_chart.copy()
-                    df_galactic_chart['l_wrapped'] = (df_galactic_chart['galactic_l'] + 180) % 360 - 180
-
-                    mw_chart = alt.Chart(df_galactic_chart).mark_circle(size=10).encode(
-                        x=alt.X('l_wrapped:Q', scale=alt.Scale(domain=[180, -180]), axis=alt.Axis(title='Galactic Longitude (l) [deg]')),
-                        y=alt.Y('galactic_b:Q', scale=alt.Scale(domain=[-90, 90]), axis=alt.Axis(title='Galactic Latitude (b) [deg]')),
-                        color=alt.Color('observatory:N', legend=alt.Legend(title="Observatory")),
-                        opacity=alt.condition(legend_selection, alt.value(0.7), alt.value(0.1)),
-                        tooltip=['object_name', 'observatory', 'l_wrapped', 'galactic_b', 'date_obs']
-                    ).add_selection(
-                        legend_selection
-                    ).properties(
-                        height=400
-                    ).interactive()
-                    
-                    st.altair_chart(mw_chart, use_container_width=True)
-                else:
-                    st.info("No valid celestial coordinates could be calculated from the filtered data.")
+            if not df_coords.empty:
+                # Compare categorical codes: -1 marks a missing name, and get_indexer also gives
+                # -1 for placeholder names absent from the categories, so one isin covers all
+                object_names = df_coords['object_name']
+                excluded_codes = np.append(object_names.cat.categories.get_indexer(PLACEHOLDER_OBJECT_NAMES), -1)
+                df_filtered_chart = df_coords[~np.isin(object_names.cat.codes.to_numpy(), excluded_codes)]
+
+                st.vega_lite_chart(df_filtered_chart, SKY_PLOT_SPEC, use_container_width=True)
             else:
                 st.info("No valid celestial coordinates found in the current search results to display the sky plot.")
             
             with st.expander("Objects found in current search"):
-                st.dataframe(distinct_objects_df, use_container_width=True)
+                st.dataframe(stats['distinct_objects_df'], use_container_width=True)
 
     # --- Data Table and File Inspector ---
     if not df.empty:
         st.header("Search Results")
         display_columns = ["filename", "object_name", "date_obs", "exptime", "altitude", "observatory"]
         
-        df_display = df[display_columns].copy()
-        df_display['date_obs'] = df_display['date_obs'].dt.strftime('%d.%m.%Y %H:%M:%S')
-        df_display['exptime'] = df_display['exptime'].map('{:,.1f}s'.format)
-        df_display['altitude'] = df_display['altitude'].map('{:.2f}°'.format) if df['altitude'].notna().any() else 'N/A'
-        
+        # Numbers and dates are sent unformatted; the browser formats them via column_config
         st.dataframe(
-            df_display, use_container_width=True, hide_index=True,
+            df[display_columns], use_container_width=True, hide_index=True,
+            column_config={
+                'date_obs': st.column_config.DatetimeColumn(format="DD.MM.YYYY HH:mm:ss"),
+                'exptime': st.column_config.NumberColumn(format="%.1fs"),
+                'altitude': st.column_config.NumberColumn(format="%.2f°"),
+            },
             on_select="rerun", selection_mode="single-row", key="results_df"
         )
         
@@ -328,26 +501,8 @@ try:
             if st.session_state.selected_file != selected_filepath:
                 st.session_state.selected_file = selected_filepath
 
-        st.selectbox(
-            "Select a file to view its header:",
-            options=file_options,
-            key='selected_file',
-            format_func=lambda x: Path(x).name if x else "...",
-            index=file_options.index(st.session_state.selected_file) if st.session_state.selected_file in file_options else 0
-        )
-        
-        if st.session_state.selected_file:
-            header_data_str = df[df['filepath'] == st.session_state.selected_file]['header_dump'].iloc[0]
-            try:
-                # Try to parse the string into a dictionary for nice display
-                header_data = json.loads(header_data_str)
-                st.json(header_data, expanded=False)
-            except (json.JSONDecodeError, TypeError):
-                # If it fails, just show the raw string
-                st.text(header_data_str)
-        else:
-            st.info("Select a file to see its header.")
-            
+        header_inspector(file_options, df['date_obs'].to_numpy())
+
     else:
         st.session_state.selected_file = None
         st.warning("No files match the current filter criteria.")
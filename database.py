@@ -1,6 +1,8 @@
 import os
 import argparse
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Index, func
+import json
+import orjson
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Float, Index, func, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.dialects.postgresql import JSONB
 from dotenv import load_dotenv
@@ -18,7 +20,18 @@ DB_NAME = os.getenv("DB_NAME")
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 # --- SQLAlchemy Setup ---
-engine = create_engine(DATABASE_URL, connect_args={"connect_timeout": 5})
+def json_serializer(value) -> str:
+    """
+    Serializes JSONB values such as header_dump with orjson, falling back to json for values
+    orjson cannot encode (e.g. integers wider than 64 bits).
+    """
+    try:
+        return orjson.dumps(value).decode()
+    except TypeError:
+        return json.dumps(value)
+
+
+engine = create_engine(DATABASE_URL, connect_args={"connect_timeout": 5}, json_serializer=json_serializer)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -36,7 +49,7 @@ class FitsFile(Base):
     object_name = Column(String, index=True)
     ra_deg = Column(Float, nullable=True)
     dec_deg = Column(Float, nullable=True)
-    date_obs = Column(DateTime)
+    date_obs = Column(DateTime, index=True)
     exptime = Column(Float)
     altitude = Column(Float)
     observatory = Column(String)
@@ -48,12 +61,19 @@ class FitsFile(Base):
     client_os = Column(String)
     client_mac = Column(String, index=True)
 
+    # File size and modification time at indexing, used to skip unchanged files on the next run
+    file_size = Column(BigInteger)
+    file_mtime_ns = Column(BigInteger)
+
     def __repr__(self):
         return f"<FitsFile(filename='{self.filename}', object='{self.object_name}', date='{self.date_obs}')>"
 
 # Add a specific index for case-insensitive search on object_name
 Index('idx_object_name_lower', func.lower(FitsFile.object_name), postgresql_using='btree')
 
+# Composite index for the client + date range filter used by almost every search
+Index('idx_fits_client_date', FitsFile.client_mac, FitsFile.date_obs)
+
 
 def get_db_session():
     """
@@ -68,10 +88,20 @@ def get_db_session():
 
 def create_tables():
     """
-    Creates the database tables if they don't exist.
+    Creates the database tables and indexes if they don't exist.
     """
     print("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    # create_all does not alter existing tables, so add any columns introduced since the table was created
+    existing_columns = {column['name'] for column in inspect(engine).get_columns(FitsFile.__tablename__)}
+    with engine.begin() as conn:
+        for column in FitsFile.__table__.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {FitsFile.__tablename__} ADD COLUMN {column.name} {column_type}"))
+    # create_all skips indexes of tables that already exist, so add any missing ones
+    for index in FitsFile.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
     print("Tables created successfully (if they didn't exist).")
 
 
@@ -3,6 +3,13 @@ from sqlalchemy import create_engine
 import os
 from dotenv import load_dotenv
 import json
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from astropy.coordinates import SkyCoord
+from astropy.units import deg
+
+from fitsdb import header_array
 
 # --- Database Configuration ---
 load_dotenv()
@@ -13,28 +20,98 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-print("Starting data export...")
-try:
-    engine = create_engine(DATABASE_URL)
-    with engine.connect() as connection:
-        # Corrected table name from 'fits_file' to 'fits_files'
-        df = pd.read_sql_table('fits_files', connection) 
+# Parquet key-value metadata entry holding the app's filter options, read by app2.py
+FILTER_OPTIONS_KEY = "fitsdb.filter_options"
+
+# Rows per Parquet row group; a header lookup reads one row group
+ROW_GROUP_SIZE = 5_000
+
+# Low-cardinality columns, stored dictionary-encoded so they load as categoricals
+DICTIONARY_COLUMNS = ['object_name', 'observatory', 'scan_root', 'client_hostname', 'client_os', 'client_mac']
+
+def parse_header(value):
+    """
+    Decodes a header_dump value, which may be JSON-encoded once or twice, into a dict.
+    A value that is not valid JSON (e.g. a hand-written header) is returned as the raw string.
+    """
+    try:
+        while isinstance(value, str):
+            value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return value
+
+def header_column(values) -> pa.Array:
+    """
+    Decodes header_dump values once and stores them as typed cards (fitsdb.HEADER_TYPE), so the app
+    gets the dict without parsing JSON. Headers that are not a JSON object are exported as null.
+    """
+    return header_array([parse_header(value) for value in values])
+
+def main():
+    print("Starting data export...")
+    try:
+        engine = create_engine(DATABASE_URL)
+        with engine.connect() as connection:
+            # Corrected table name from 'fits_file' to 'fits_files'
+            df = pd.read_sql_table('fits_files', connection) 
     
-    # Parquet doesn't support JSONB directly. Convert to a valid JSON string.
-    if 'header_dump' in df.columns:
-        df['header_dump'] = df['header_dump'].apply(json.dumps)
-
-    # Convert any timezone-aware datetime columns to timezone-naive
-    # This avoids potential issues when reading the parquet file in different environments
-    for col in df.select_dtypes(include=['datetimetz']).columns:
-        df[col] = df[col].dt.tz_localize(None)
+        # Parsed once here; the app reads the typed cards of one file when it is inspected
+        header_array = header_column(df.pop('header_dump'))
+
+        # Precompute galactic coordinates so the app does not have to transform them on every session.
+        # Rows without ra/dec get NaN.
+        galactic = SkyCoord(
+            ra=df['ra_deg'].to_numpy(dtype='float64') * deg,
+            dec=df['dec_deg'].to_numpy(dtype='float64') * deg,
+            frame='icrs',
+        ).galactic
+        df['galactic_l'] = galactic.l.deg
+        df['galactic_b'] = galactic.b.deg
+        # Longitude wrapped to [-180, 180) so l=0 is in the center of the sky plot
+        df['l_wrapped'] = (df['galactic_l'] + 180) % 360 - 180
+
+        # Convert any timezone-aware datetime columns to timezone-naive
+        # This avoids potential issues when reading the parquet file in different environments
+        for col in df.select_dtypes(include=['datetimetz']).columns:
+            df[col] = df[col].dt.tz_localize(None)
         
-    # Export the dataframe to a parquet file
-    df.to_parquet('fits_data.parquet', index=False, version='1.0')
+        # Distinct filter options for the app, stored in the Parquet metadata so it does not
+        # have to scan the columns at startup. Same rules as get_filter_options_from_df.
+        dated = df[df['date_obs'].notna()]
+        filter_options = None
+        if not dated.empty:
+            filter_options = {
+                'object_names': sorted(name for name in dated['object_name'].dropna().unique() if name and name not in ['Unknown', 'flatwizard']),
+                'observatories': sorted(obs for obs in dated['observatory'].dropna().unique() if obs and obs != 'Unknown'),
+                'exptimes': sorted(dated['exptime'].dropna().unique().tolist()),
+                'min_date': dated['date_obs'].min().date().isoformat(),
+                'max_date': dated['date_obs'].max().date().isoformat(),
+            }
+
+        for col in DICTIONARY_COLUMNS:
+            df[col] = df[col].astype('category')
+
+        # Export the dataframe to a parquet file
+        # header_dump is appended on the Arrow side; pandas metadata cannot describe a map column
+        table = pa.Table.from_pandas(df, preserve_index=False).append_column('header_dump', header_array)
+        if filter_options is not None:
+            table = table.replace_schema_metadata({**table.schema.metadata, FILTER_OPTIONS_KEY: json.dumps(filter_options)})
+        # Sorted by date_obs the app can slice date ranges by binary search, and the per-row-group
+        # min/max statistics let its header lookup skip every row group that cannot contain the file
+        table = table.sort_by('date_obs')
+        # Dictionary pages only pay off for the repetitive columns; ZSTD compresses the rest
+        pq.write_table(table, 'fits_data.parquet', version='2.6', compression='zstd', use_dictionary=DICTIONARY_COLUMNS,
+                       data_page_size=1 << 20, row_group_size=ROW_GROUP_SIZE, write_statistics=True)
+        # Uncompressed Arrow IPC copy the app memory-maps on cold start; headers are still looked up in the Parquet file
+        feather.write_feather(table.drop_columns(['header_dump']), 'fits_data.feather', compression='uncompressed')
     
-    print(f"Successfully exported {len(df)} rows to fits_data.parquet")
-    print("You can now modify 'app.py' to read from this file instead of the database.")
+        print(f"Successfully exported {len(df)} rows to fits_data.parquet and fits_data.feather")
+        print("You can now modify 'app.py' to read from this file instead of the database.")
+
+    except Exception as e:
+        print(f"An error occurred during export: {e}")
+        print("Please ensure your .env file is correctly configured and the database is running.")
 
-except Exception as e:
-    print(f"An error occurred during export: {e}")
-    print("Please ensure your .env file is correctly configured and the database is running.")
+if __name__ == "__main__":
+    main()
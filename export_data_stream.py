@@ -1,7 +1,10 @@
-import pandas as pd
 import json
 import sys
 import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from fitsdb import decode_header
 
 # Define the path to the Parquet file
 # Assuming this script is run from the `fitsdb` directory
@@ -16,15 +19,19 @@ absolute_parquet_file_path = os.path.join(script_dir, parquet_file_path)
 
 try:
     # Read the Parquet file
-    df = pd.read_parquet(absolute_parquet_file_path)
+    table = pq.read_table(absolute_parquet_file_path)
+    headers = None
+    header_index = table.schema.get_field_index('header_dump')
+    if header_index >= 0 and pa.types.is_map(table.schema.field(header_index).type):
+        # Typed header cards are decoded on the Arrow side; pandas would widen their integers to floats
+        headers = [None if cards is None else decode_header(cards) for cards in table.column('header_dump').to_pylist()]
+        table = table.drop_columns(['header_dump'])
+    df = table.to_pandas()
+    if headers is not None:
+        df.insert(header_index, 'header_dump', headers)
 
-    # Stream each row as a JSON object to stdout
-    # df.to_json(sys.stdout, orient='records', lines=True) would be more efficient,
-    # but iterrows ensures each record is a standalone JSON object on a new line.
-    # For now, let's stick to iterrows to match the previous streaming intent.
-    for index, row in df.iterrows():
-        json_record = row.to_json()
-        sys.stdout.write(json_record + '\n')
+    # Stream each row as a standalone JSON object on its own line to stdout
+    df.to_json(sys.stdout, orient='records', lines=True, date_format='iso')
 
 except FileNotFoundError:
     sys.stderr.write(json.dumps({"error": f"Parquet file not found at {absolute_parquet_file_path}"}) + '\n')
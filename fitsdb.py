@@ -0,0 +1,56 @@
+"""Helpers shared by the Parquet export (export_data.py) and its readers (app2.py, export_data_stream.py)."""
+import numpy as np
+import pyarrow as pa
+
+# A header card value, stored in the field matching its type; blank cards are a null value
+HEADER_VALUE_TYPE = pa.struct([
+    ('logical', pa.bool_()),
+    ('integer', pa.int64()),
+    ('real', pa.float64()),
+    ('text', pa.string()),
+])
+
+# header_dump as stored in the Parquet file: the cards in header order. Unlike one struct type
+# inferred across all files, each file keeps its own keywords, card order and value types.
+HEADER_TYPE = pa.map_(pa.string(), HEADER_VALUE_TYPE)
+
+INT64_RANGE = range(-2**63, 2**63)
+
+
+def header_value(value) -> dict | None:
+    """Wraps one header_dump value into a HEADER_VALUE_TYPE struct."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return {'logical': value}
+    if isinstance(value, int) and value in INT64_RANGE:
+        return {'integer': value}
+    if isinstance(value, float):
+        return {'real': value}
+    # Strings, and integers too wide for int64, are kept as text
+    return {'text': value if isinstance(value, str) else str(value)}
+
+
+def header_array(headers) -> pa.Array:
+    """Builds a HEADER_TYPE column from header_dump dicts; any other value (e.g. a header that is not JSON) is null."""
+    return pa.array(
+        [[(keyword, header_value(value)) for keyword, value in header.items()] if isinstance(header, dict) else None
+         for header in headers],
+        type=HEADER_TYPE,
+    )
+
+
+def decode_header(cards: list[tuple[str, dict | None]]) -> dict:
+    """Turns a HEADER_TYPE value, as returned by as_py(), back into the header_dump dict."""
+    return {
+        keyword: None if value is None else next((field for field in value.values() if field is not None), None)
+        for keyword, value in cards
+    }
+
+
+def count_nights(date_obs: np.ndarray) -> int:
+    """Counts the distinct observation days in an array of datetime64 values, ignoring NaT."""
+    # Truncate to days at the numpy level instead of building a datetime.date per row;
+    # unlike nunique, np.unique counts NaT as a value, so missing dates are dropped first
+    days = date_obs.astype('datetime64[D]')
+    return np.unique(days[~np.isnat(days)]).size
@@ -1,29 +1,85 @@
 import os
 import argparse
-import json
+import io
+import logging
+import math
+import multiprocessing
+import re
 from pathlib import Path
 from datetime import datetime
 import socket
 import platform
 import uuid
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from itertools import repeat
+from logging.handlers import QueueHandler, QueueListener
 
+import erfa
+import numpy as np
 from astropy.io import fits
 from astropy.coordinates import SkyCoord, EarthLocation, AltAz
 from astropy.time import Time
 from astropy import units as u
-from sqlalchemy.orm import Session
+import psycopg2
+from sqlalchemy import column, select, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 from tqdm import tqdm
 
-from database import SessionLocal, FitsFile
+from database import engine, json_serializer, FitsFile
 
 # --- Constants ---
 # Default observatory location (Leopold Figl Observatory, Austria)
 # Used if FITS header does not contain site coordinates.
 DEFAULT_LOCATION = EarthLocation(lat=48.129*u.deg, lon=16.024*u.deg, height=940*u.m)
 
+# Sexagesimal RA/DEC values as most capture software writes them, e.g. '05 35 17.3' or '-05:23:28'
+SEXAGESIMAL_PATTERN = re.compile(r'\s*([+-]?)(\d+)[: ](\d+)[: ](\d+(?:\.\d*)?)\s*')
+
+# Default file the parse and write errors are logged to instead of the console (see --log-file)
+LOG_FILE = 'indexer.log'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(processName)s: %(message)s'
+
+log = logging.getLogger('indexer')
+
+# Number of directories read concurrently during the file search
+SCAN_THREADS = 16
+
+# Files handed to a worker process at once; the worker reads their headers ahead of parsing them
+FILE_CHUNK_SIZE = 32
+
+# Number of threads per worker process reading headers ahead of the parser
+HEADER_READ_THREADS = 4
+
+# FITS files are made of 2880-byte blocks of 80-character cards; the header ends with the END card
+FITS_BLOCK_SIZE = 2880
+FITS_CARD_SIZE = 80
+
+# Keywords of the cards holding free text instead of a "= value / comment" field
+COMMENTARY_KEYWORDS = frozenset({'', 'COMMENT', 'HISTORY'})
+
+# Keywords as astropy stores them; other cards (lowercase, HIERARCH, ...) are left to astropy
+KEYWORD_PATTERN = re.compile(r'[A-Z0-9_-]+')
+
+# Value field of a card with a string, logical, integer or real value, or no value, and an optional comment
+CARD_VALUE_PATTERN = re.compile(
+    r" *(?:'((?:[^']|'')*)'|([TF])|([+-]?\d+)|([+-]?(?:\d+\.?\d*|\.\d+)(?:[EeDd][+-]?\d+)?))? *(?:/.*)?"
+)
+
+# Number of records written per INSERT ... ON CONFLICT statement and transaction
+UPSERT_BATCH_SIZE = 1000
+
+# Columns overwritten when an already indexed file is indexed again
+UPDATE_COLUMNS = [column.name for column in FitsFile.__table__.columns if column.name not in ('id', 'filepath')]
+
+# Columns of a record, in the order they are sent by COPY
+COPY_COLUMNS = ['filepath'] + UPDATE_COLUMNS
+
+# Per-transaction temporary table that COPY loads before the rows are merged into fits_files
+STAGING_TABLE = 'fits_files_staging'
+
 # --- Helper Functions ---
 
 def get_client_info() -> dict:
@@ -47,127 +103,453 @@ def get_client_info() -> dict:
         }
 
 
-def extract_and_convert_coords(header: fits.Header) -> tuple[float | None, float | None, SkyCoord | None]:
+def parse_sexagesimal(value) -> float | None:
+    """Converts a sexagesimal string to decimal hours/degrees, or returns None for any other layout."""
+    match = SEXAGESIMAL_PATTERN.fullmatch(value) if isinstance(value, str) else None
+    if match is None:
+        return None
+    sign, whole, minutes, seconds = match.groups()
+    minutes, seconds = int(minutes), float(seconds)
+    if minutes >= 60 or seconds >= 60:
+        return None
+    decimal = int(whole) + minutes / 60 + seconds / 3600
+    return -decimal if sign == '-' else decimal
+
+
+def extract_and_convert_coords(header: fits.Header | dict) -> tuple[float | None, float | None]:
     """Extracts RA/DEC from FITS header and converts to decimal degrees."""
     ra_str = header.get('RA') or header.get('OBJCTRA')
     dec_str = header.get('DEC') or header.get('OBJCTDEC')
+    if not (ra_str and dec_str):
+        return None, None
+    # Plain sexagesimal values are converted directly; SkyCoord handles everything else
+    ra_hours, dec_deg = parse_sexagesimal(ra_str), parse_sexagesimal(dec_str)
+    if ra_hours is not None and dec_deg is not None and abs(dec_deg) <= 90:
+        return (ra_hours * 15) % 360, dec_deg
     try:
-        if ra_str and dec_str:
-            # Ensure values are strings for SkyCoord
-            coords = SkyCoord(str(ra_str), str(dec_str), unit=(u.hourangle, u.deg), frame='icrs')
-            # Explicitly cast to Python floats to prevent numpy type issues with SQLAlchemy
-            return float(coords.ra.deg), float(coords.dec.deg), coords
+        # Ensure values are strings for SkyCoord
+        coords = SkyCoord(str(ra_str), str(dec_str), unit=(u.hourangle, u.deg), frame='icrs')
+        # Explicitly cast to Python floats to prevent numpy type issues with SQLAlchemy
+        return float(coords.ra.deg), float(coords.dec.deg)
     except (ValueError, TypeError, AttributeError) as e:
         # VERBOSE LOGGING: Print the error and the problematic values
-        tqdm.write(f"Coordinate parse error: {e}. RA: '{ra_str}', DEC: '{dec_str}'")
+        log.warning("Coordinate parse error: %s. RA: '%s', DEC: '%s'", e, ra_str, dec_str)
+    return None, None
+
+
+def list_directory(directory: str, extensions: tuple[str, ...]) -> tuple[list[str], list[tuple[Path, int | None, int | None]]]:
+    """
+    Lists one directory, returning its subdirectories to descend into and its files with the given
+    extensions as (path, size, mtime_ns) tuples.
+    Like os.walk, symlinked directories are not followed and unreadable directories are skipped.
+    Below a resolved directory only symlinked files need resolving, so the paths come back resolved.
+    """
+    subdirectories, files = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if not entry.is_symlink():
+                        subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    path = Path(os.path.realpath(entry.path) if entry.is_symlink() else entry.path)
+                    try:
+                        stat = entry.stat()
+                        files.append((path, stat.st_size, stat.st_mtime_ns))
+                    except OSError:
+                        # Without a stat the file cannot be compared with its last run, so it is always indexed
+                        files.append((path, None, None))
+    except OSError:
         pass
-    return None, None, None
+    return subdirectories, files
+
+
+def find_files(root_directory: str, extensions: tuple[str, ...]) -> list[tuple[Path, int | None, int | None]]:
+    """
+    Recursively finds the files with the given extensions, reading up to SCAN_THREADS directories at a time.
+    The returned paths are resolved, with the root resolved once instead of every file, and unique:
+    symlinks to an already found file are dropped.
+    """
+    root_directory = os.path.realpath(root_directory)
+    files = []
+    # scandir releases the GIL, so threads overlap the directory reads
+    with ThreadPoolExecutor(max_workers=SCAN_THREADS) as executor:
+        pending = {executor.submit(list_directory, root_directory, extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirectories, found = future.result()
+                files.extend(found)
+                pending.update(executor.submit(list_directory, subdirectory, extensions) for subdirectory in subdirectories)
+    return list({file[0]: file for file in files}.values())
+
+
+def filter_changed_files(files: list[tuple[Path, int | None, int | None]], scan_root: str) -> list[tuple[Path, int | None, int | None]]:
+    """
+    Drops the files whose size and modification time match their record from an earlier run of the same scan root.
+    """
+    with engine.connect() as conn:
+        indexed = {
+            filepath: (file_size, file_mtime_ns)
+            for filepath, file_size, file_mtime_ns in conn.execute(
+                select(FitsFile.filepath, FitsFile.file_size, FitsFile.file_mtime_ns).where(FitsFile.scan_root == scan_root)
+            )
+        }
+    if not indexed:
+        return files
+    return [file for file in files if file[1] is None or indexed.get(str(file[0])) != file[1:]]
 
 
-def calculate_altitude(header: fits.Header, location: EarthLocation, coords: SkyCoord | None) -> float | None:
+def get_observation(header: fits.Header | dict, location: EarthLocation, ra_deg: float | None, dec_deg: float | None) -> tuple | None:
     """
-    Calculates the altitude of the observed object.
+    Collects the inputs calculate_altitudes needs for one file:
+    (ra_deg, dec_deg, jd1, jd2, (site_lat, site_lon, site_height)).
     """
     try:
-        if coords is None:
+        if ra_deg is None or dec_deg is None:
             return None
         date_obs_str = header.get('DATE-OBS')
         if not date_obs_str:
             return None
         time = Time(date_obs_str, format='isot', scale='utc')
-        altaz_frame = AltAz(obstime=time, location=location)
-        obj_altaz = coords.transform_to(altaz_frame)
-        return float(obj_altaz.alt.deg)
+        site = (float(location.lat.deg), float(location.lon.deg), float(location.height.to_value(u.m)))
+        return ra_deg, dec_deg, float(time.jd1), float(time.jd2), site
     except (ValueError, KeyError, TypeError) as e:
-        tqdm.write(f"Altitude calculation error: {e} for object {header.get('OBJECT')}")
+        log.warning("Altitude calculation error: %s for object %s", e, header.get('OBJECT'))
         return None
 
 
-def process_fits_file(file_path: Path, client_info: dict, scan_root: str) -> str:
+def altitudes_erfa(ra_deg: np.ndarray, dec_deg: np.ndarray, time: Time, site_lat: float, site_lon: float) -> np.ndarray:
     """
-    Reads a FITS file, extracts metadata, and upserts it into the database.
-    This function is designed to be thread-safe by managing its own DB session.
+    Altitudes from the hour angle of the coordinates precessed to the date of observation.
+    Nutation, aberration and refraction are ignored, which keeps the result within 0.01 degrees
+    of the full AltAz transform at a fraction of its cost.
+    """
+    tt, ut1 = time.tt, time.ut1
+    ra, dec = np.radians(ra_deg), np.radians(dec_deg)
+    # Precess the ICRS unit vectors to the mean equator and equinox of date
+    vectors = np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1)
+    vectors = np.einsum('nij,nj->ni', erfa.pmat06(tt.jd1, tt.jd2), vectors)
+    ra_date, dec_date = np.arctan2(vectors[:, 1], vectors[:, 0]), np.arcsin(vectors[:, 2])
+    hour_angle = erfa.gmst06(ut1.jd1, ut1.jd2, tt.jd1, tt.jd2) + np.radians(site_lon) - ra_date
+    lat = np.radians(site_lat)
+    return np.degrees(np.arcsin(np.sin(lat) * np.sin(dec_date) + np.cos(lat) * np.cos(dec_date) * np.cos(hour_angle)))
+
+
+def altitudes_astropy(ra_deg: np.ndarray, dec_deg: np.ndarray, time: Time, site_lat: float, site_lon: float, site_height: float) -> np.ndarray:
+    """
+    Altitudes from the full astropy ICRS to AltAz transform, used to validate altitudes_erfa.
+    """
+    location = EarthLocation(lat=site_lat*u.deg, lon=site_lon*u.deg, height=site_height*u.m)
+    altaz_frame = AltAz(obstime=time, location=location)
+    return SkyCoord(ra=ra_deg*u.deg, dec=dec_deg*u.deg, frame='icrs').transform_to(altaz_frame).alt.deg
+
+
+def calculate_altitudes(observations: list[tuple | None], use_astropy: bool = False) -> list[float | None]:
+    """
+    Calculates the altitudes of a batch of observations, with one array calculation per site.
+    """
+    altitudes = [None] * len(observations)
+    indices_by_site = {}
+    for i, observation in enumerate(observations):
+        if observation is not None:
+            indices_by_site.setdefault(observation[4], []).append(i)
+
+    for (site_lat, site_lon, site_height), indices in indices_by_site.items():
+        ra_deg, dec_deg, jd1, jd2 = np.array([observations[i][:4] for i in indices]).T
+        # Runs in the main process: any error (ERFA, IERS tables, ...) only costs this site's altitudes, not the run
+        try:
+            time = Time(jd1, jd2, format='jd', scale='utc')
+            if use_astropy:
+                site_altitudes = altitudes_astropy(ra_deg, dec_deg, time, site_lat, site_lon, site_height)
+            else:
+                site_altitudes = altitudes_erfa(ra_deg, dec_deg, time, site_lat, site_lon)
+        except Exception as e:
+            log.warning("Altitude calculation error: %s for %d files at site (%s, %s)", e, len(indices), site_lat, site_lon)
+            continue
+        for i, altitude in zip(indices, site_altitudes):
+            altitudes[i] = float(altitude)
+    return altitudes
+
+
+@lru_cache(maxsize=256)
+def site_location(site_lat: str, site_lon: str) -> EarthLocation:
+    """
+    Builds the EarthLocation for the header's site coordinates, falling back to DEFAULT_LOCATION.
+    Cached, as the files of one dataset nearly always share the same site.
     """
-    db = SessionLocal()
     try:
-        with fits.open(file_path, 'readonly', memmap=False) as hdul:
-            header = hdul[0].header
-
-            # --- Extract Metadata ---
-            filepath_str = str(file_path.resolve())
-            object_name = header.get('OBJECT', 'Unknown')
-            date_obs_str = header.get('DATE-OBS')
-            exptime = float(header.get('EXPTIME') or header.get('EXPOSURE', 0.0))
-            observatory = header.get('OBSERVAT') or header.get('TELESCOP', 'Unknown')
-            date_obs = None
-            if date_obs_str:
-                try:
-                    date_obs = datetime.fromisoformat(date_obs_str)
-                except (ValueError, TypeError):
-                    pass
-
-            # --- Coordinates and Altitude ---
-            ra_deg, dec_deg, coords = extract_and_convert_coords(header)
-            
-            site_lat = header.get('SITELAT') or header.get('LATITUDE')
-            site_lon = header.get('SITELON') or header.get('LONGITUD')
-            location = DEFAULT_LOCATION
-            if site_lat and site_lon:
-                try:
-                    location = EarthLocation.from_geodetic(lon=str(site_lon), lat=str(site_lat))
-                except (u.UnitConversionError, ValueError):
-                    pass
-            
-            altitude = calculate_altitude(header, location, coords)
-
-            # --- Prepare DB record ---
-            # Ensure all values are JSON serializable
-            header_dict = {}
-            for k, v in header.items():
-                if isinstance(v, (str, int, float, bool)) or v is None:
-                    header_dict[k] = v
-                else:
-                    header_dict[k] = repr(v) # Use repr for non-standard types
+        return EarthLocation.from_geodetic(lon=site_lon, lat=site_lat)
+    except (u.UnitConversionError, ValueError):
+        return DEFAULT_LOCATION
+
+
+def read_header_bytes(file_path: Path) -> bytes | None:
+    """
+    Reads the blocks of the primary header, up to and including the block with the END card.
+    Returns None if the file cannot be read or does not look like a FITS file, leaving the error to Header.fromfile.
+    """
+    blocks = []
+    try:
+        with open(file_path, 'rb') as f:
+            while len(block := f.read(FITS_BLOCK_SIZE)) == FITS_BLOCK_SIZE:
+                if not blocks and not block.startswith(b'SIMPLE  '):
+                    return None
+                blocks.append(block)
+                if any(block.startswith(b'END     ', offset) for offset in range(0, FITS_BLOCK_SIZE, FITS_CARD_SIZE)):
+                    return b''.join(blocks)
+    except OSError:
+        pass
+    return None
+
+
+def parse_header_cards(header_data: bytes) -> dict | None:
+    """
+    Parses the header blocks from read_header_bytes into a keyword -> value dict, with the values
+    Header.items() gives (where repeated keywords keep their last value).
+    Handles the single-card values capture software writes; returns None for any other card
+    (CONTINUE, HIERARCH, complex values, repeated keywords, ...), so that header is parsed by astropy.
+    """
+    if not header_data.isascii():
+        return None
+    text = header_data.decode('ascii')
+    if not text.isprintable():
+        return None
+    cards = {}
+    for offset in range(0, len(text), FITS_CARD_SIZE):
+        keyword = text[offset:offset + 8].rstrip()
+        if keyword == 'END':
+            return cards
+        if keyword in COMMENTARY_KEYWORDS:
+            cards[keyword] = text[offset + 8:offset + FITS_CARD_SIZE].rstrip()
+            continue
+        # Header.get returns the first of repeated keywords, a dict the last one
+        if keyword in cards or text[offset + 8:offset + 10] != '= ' or not KEYWORD_PATTERN.fullmatch(keyword):
+            return None
+        match = CARD_VALUE_PATTERN.fullmatch(text, offset + 10, offset + FITS_CARD_SIZE)
+        if match is None:
+            return None
+        string, logical, integer, real = match.groups()
+        if string is not None:
+            cards[keyword] = string.replace("''", "'").rstrip(' ')
+        elif logical is not None:
+            cards[keyword] = logical == 'T'
+        elif integer is not None:
+            cards[keyword] = int(integer)
+        elif real is not None:
+            cards[keyword] = float(real.replace('D', 'E').replace('d', 'e'))
+        else:
+            cards[keyword] = None
+    return None
+
+
+@lru_cache(maxsize=1)
+def get_header_reader() -> ThreadPoolExecutor:
+    """Returns this process's thread pool for read_header_bytes, created on first use."""
+    return ThreadPoolExecutor(max_workers=HEADER_READ_THREADS)
+
+
+def process_fits_files(files: list[tuple[Path, int | None, int | None]], client_info: dict, scan_root: str) -> list[tuple[dict, tuple | None] | None]:
+    """
+    Processes a chunk of (path, size, mtime_ns) files in a worker process. The headers are read by
+    HEADER_READ_THREADS threads while the already read ones are parsed, hiding slow storage behind the parsing.
+    """
+    header_blocks = get_header_reader().map(read_header_bytes, [file[0] for file in files])
+    return [
+        process_fits_file(file_path, file_size, file_mtime_ns, client_info, scan_root, header_data)
+        for (file_path, file_size, file_mtime_ns), header_data in zip(files, header_blocks)
+    ]
 
-            header_dump = json.dumps(header_dict)
 
-            existing_file = db.query(FitsFile).filter(FitsFile.filepath == filepath_str).first()
+def process_fits_file(file_path: Path, file_size: int | None, file_mtime_ns: int | None, client_info: dict, scan_root: str, header_data: bytes | None = None) -> tuple[dict, tuple | None] | None:
+    """
+    Reads a FITS file and extracts its metadata as a dict of fits_files column values, plus the
+    observation calculate_altitudes turns into the record's altitude (see get_observation).
+    Does no database work and takes only picklable arguments, so it can run in worker processes.
+    file_path is stored as is, so it must already be resolved (find_files returns resolved paths).
+    header_data are the header blocks if they were already read (see read_header_bytes).
+    """
+    try:
+        # Only the primary header is needed; plain headers are parsed directly, anything else by astropy
+        header = parse_header_cards(header_data) if header_data is not None else None
+        if header is None:
+            header = fits.Header.fromfile(file_path) if header_data is None else fits.Header.fromstring(header_data)
+
+        # --- Extract Metadata ---
+        filepath_str = str(file_path)
+        object_name = header.get('OBJECT', 'Unknown')
+        date_obs_str = header.get('DATE-OBS')
+        exptime = float(header.get('EXPTIME') or header.get('EXPOSURE', 0.0))
+        observatory = header.get('OBSERVAT') or header.get('TELESCOP', 'Unknown')
+        date_obs = None
+        if date_obs_str:
+            try:
+                date_obs = datetime.fromisoformat(date_obs_str)
+            except (ValueError, TypeError):
+                pass
 
-            if existing_file:
-                record = existing_file
-                status = "Updated"
+        # --- Coordinates and Altitude ---
+        ra_deg, dec_deg = extract_and_convert_coords(header)
+        
+        site_lat = header.get('SITELAT') or header.get('LATITUDE')
+        site_lon = header.get('SITELON') or header.get('LONGITUD')
+        location = site_location(str(site_lat), str(site_lon)) if site_lat and site_lon else DEFAULT_LOCATION
+        
+        # The altitude itself is calculated per batch in the main process
+        observation = get_observation(header, location, ra_deg, dec_deg)
+
+        # --- Prepare DB record ---
+        # Ensure all values are JSON serializable; the dict is handed to the JSONB column as is,
+        # so it is serialized exactly once, when the batch is written
+        header_dump = {}
+        for k, v in header.items():
+            if isinstance(v, float) and not math.isfinite(v):
+                header_dump[k] = repr(v) # JSONB has no NaN or Infinity
+            elif isinstance(v, (str, int, float, bool)) or v is None:
+                header_dump[k] = v
             else:
-                record = FitsFile(filepath=filepath_str, filename=file_path.name)
-                db.add(record)
-                status = "Created"
-
-            # Update all fields
-            record.object_name = object_name
-            record.ra_deg = ra_deg
-            record.dec_deg = dec_deg
-            record.date_obs = date_obs
-            record.exptime = exptime
-            record.altitude = altitude
-            record.observatory = observatory
-            record.header_dump = header_dump
-            record.scan_root = scan_root
-            record.client_hostname = client_info['hostname']
-            record.client_os = client_info['os']
-            record.client_mac = client_info['mac']
-            
-            db.commit()
-            return f"{status}: {file_path.name}"
+                header_dump[k] = repr(v) # Use repr for non-standard types
+
+        return {
+            'filepath': filepath_str,
+            'filename': file_path.name,
+            'object_name': object_name,
+            'ra_deg': ra_deg,
+            'dec_deg': dec_deg,
+            'date_obs': date_obs,
+            'exptime': exptime,
+            'altitude': None,
+            'observatory': observatory,
+            'header_dump': header_dump,
+            'scan_root': scan_root,
+            'client_hostname': client_info['hostname'],
+            'client_os': client_info['os'],
+            'client_mac': client_info['mac'],
+            # Stat from the file search, so a file changed while it is being read is indexed again next run
+            'file_size': file_size,
+            'file_mtime_ns': file_mtime_ns,
+        }, observation
 
     except Exception as e:
-        db.rollback()
         # VERBOSE LOGGING: Print the main processing error
-        tqdm.write(f"!!! CRITICAL ERROR processing {file_path.name}: {e}")
-        return f"Error processing {file_path.name}"
-    finally:
-        db.close()
+        log.error("Error processing %s: %s", file_path, e)
+        return None
+
+
+@lru_cache(maxsize=1)
+def build_upsert_statement():
+    """
+    Builds the single-row INSERT ... ON CONFLICT (filepath) DO UPDATE statement, once per process.
+    """
+    stmt = pg_insert(FitsFile.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=['filepath'],
+        set_={column: stmt.excluded[column] for column in UPDATE_COLUMNS},
+    )
 
 
-def run_indexer(root_directory: str, max_workers: int):
+def unique_records(records: list[dict]) -> list[dict]:
+    """
+    Keeps the last record per filepath. An ON CONFLICT DO UPDATE statement fails as a whole
+    if it would update the same row twice.
+    """
+    return list({record['filepath']: record for record in records}.values())
+
+
+def upsert_records(records: list[dict]):
+    """
+    Writes a batch of records in one transaction; files that are already indexed are updated in place.
+    """
+    try:
+        with engine.begin() as conn:
+            # executemany: the compiled statement is reused and SQLAlchemy packs the records into multi-row VALUES
+            conn.execute(build_upsert_statement(), unique_records(records))
+    except SQLAlchemyError as e:
+        log.error("Error writing a batch of %d records: %s", len(records), e)
+
+
+def copy_value(value) -> str:
+    """
+    Formats a record value as a field of PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return r'\N'
+    if isinstance(value, dict):
+        value = json_serializer(value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+@lru_cache(maxsize=1)
+def build_merge_statement():
+    """
+    Builds the INSERT ... SELECT ... ON CONFLICT that merges the staging table into fits_files, once per process.
+    """
+    staging = table(STAGING_TABLE, *(column(name) for name in COPY_COLUMNS))
+    stmt = pg_insert(FitsFile.__table__).from_select(COPY_COLUMNS, select(staging))
+    return stmt.on_conflict_do_update(
+        index_elements=['filepath'],
+        set_={name: stmt.excluded[name] for name in UPDATE_COLUMNS},
+    )
+
+
+def copy_records(records: list[dict]):
+    """
+    Writes a batch of records like upsert_records, but sends them with COPY into a staging table
+    that is then merged into fits_files, which has far less per-row protocol overhead.
+    """
+    # A filepath staged twice would make the merge's ON CONFLICT DO UPDATE fail for the whole batch
+    rows = ('\t'.join(copy_value(record[name]) for name in COPY_COLUMNS) + '\n' for record in unique_records(records))
+    buffer = io.StringIO(''.join(rows))
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+                f"SELECT {', '.join(COPY_COLUMNS)} FROM {FitsFile.__tablename__} WITH NO DATA"
+            ))
+            conn.connection.cursor().copy_expert(f"COPY {STAGING_TABLE} ({', '.join(COPY_COLUMNS)}) FROM STDIN", buffer)
+            conn.execute(build_merge_statement())
+    except (SQLAlchemyError, psycopg2.Error) as e:
+        log.error("Error copying a batch of %d records: %s", len(records), e)
+
+
+def write_batch(records: list[dict], observations: list[tuple | None], use_astropy: bool = False, bulk: bool = False):
+    """
+    Fills in the altitudes of a batch of records and writes them, with COPY if bulk is set.
+    """
+    for record, altitude in zip(records, calculate_altitudes(observations, use_astropy)):
+        record['altitude'] = altitude
+    if bulk:
+        copy_records(records)
+    else:
+        upsert_records(records)
+
+
+def init_worker_logging(log_queue: multiprocessing.Queue) -> None:
+    """Hands this process's log records to log_queue; also the initializer of the worker processes."""
+    log.handlers[:] = [QueueHandler(log_queue)]
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+def start_logging(log_file: str = LOG_FILE) -> tuple[multiprocessing.Queue, QueueListener]:
+    """
+    Starts a listener thread that writes the records of log_queue to log_file, so a log call
+    in the hot path, in this or a worker process, only enqueues the record.
+    """
+    log_queue = multiprocessing.Queue()
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    init_worker_logging(log_queue)
+    return log_queue, listener
+
+
+def run_indexer(root_directory: str, max_workers: int, astropy_altitudes: bool = False, force: bool = False, bulk: bool = False, log_file: str = LOG_FILE):
     """
     Scans a directory for FITS files and indexes them concurrently.
     """
@@ -184,9 +566,7 @@ def run_indexer(root_directory: str, max_workers: int):
     print(f"Phase 1: Recursively searching for files with extensions: {extensions}...")
 
     try:
-        files_to_process = [Path(dirpath) / filename 
-                            for dirpath, _, filenames in os.walk(root_directory) 
-                            for filename in filenames if filename.lower().endswith(extensions)]
+        files_to_process = find_files(root_directory, extensions)
     except Exception as e:
         print(f"An error occurred during file search: {e}")
         return
@@ -197,22 +577,50 @@ def run_indexer(root_directory: str, max_workers: int):
         return
 
     print(f"Phase 1 Complete: Found {total_found} potential FITS files.")
-    print(f"Phase 2: Processing and indexing files with up to {max_workers} concurrent workers...\n")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks to the executor
-        futures = {executor.submit(process_fits_file, fp, client_info, root_directory) for fp in files_to_process}
+    if not force:
+        files_to_process = filter_changed_files(files_to_process, root_directory)
+        print(f"Skipping {total_found - len(files_to_process)} files unchanged since they were last indexed.")
+        if not files_to_process:
+            print("\nIndexing complete.")
+            return
 
-        # Process results as they complete with a progress bar
-        for future in tqdm(as_completed(futures), total=total_found, desc="Indexing Files", unit="file"):
-            try:
-                result = future.result()
-                # Optionally, you can log the result to a file if the output is too noisy.
-                # tqdm.write(result) 
-            except Exception as e:
-                tqdm.write(f"A task generated an exception: {e}")
+    print(f"Phase 2: Processing and indexing files with up to {max_workers} worker processes...\n")
+    chunks = [files_to_process[i:i + FILE_CHUNK_SIZE] for i in range(0, len(files_to_process), FILE_CHUNK_SIZE)]
+
+    if not bulk:
+        # The first ingest into an empty table is written with COPY
+        with engine.connect() as conn:
+            bulk = conn.execute(select(FitsFile.id).limit(1)).first() is None
+    if bulk:
+        print("Writing the records with COPY (bulk ingest).\n")
+
+    log_queue, listener = start_logging(log_file)
+    try:
+        # Header parsing and the astropy transforms hold the GIL, so the files are processed in separate processes
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker_logging, initargs=(log_queue,)) as executor:
+            # Files are sent to the workers in chunks to amortize the pickling round-trip and to let them read ahead
+            chunk_results = executor.map(process_fits_files, chunks, repeat(client_info), repeat(root_directory))
+
+            # Collect results with a progress bar and write them in batches
+            records, observations = [], []
+            with tqdm(total=len(files_to_process), desc="Indexing Files", unit="file") as progress:
+                for results in chunk_results:
+                    for result in results:
+                        if result is not None:
+                            record, observation = result
+                            records.append(record)
+                            observations.append(observation)
+                    progress.update(len(results))
+                    if len(records) >= UPSERT_BATCH_SIZE:
+                        write_batch(records, observations, astropy_altitudes, bulk)
+                        records, observations = [], []
+            if records:
+                write_batch(records, observations, astropy_altitudes, bulk)
+    finally:
+        listener.stop()
     
-    print("\nIndexing complete.")
+    print(f"\nIndexing complete. Errors and warnings, if any, were logged to {log_file}.")
 
 
 
@@ -232,7 +640,27 @@ if __name__ == "__main__":
         "-w", "--workers",
         type=int,
         default=8,
-        help="Number of concurrent worker threads to use for indexing. Default is 8."
+        help="Number of worker processes to use for indexing. Default is 8."
+    )
+    parser.add_argument(
+        "--astropy-altitudes",
+        action="store_true",
+        help="Calculate altitudes with the full astropy AltAz transform instead of the faster ERFA approximation, e.g. to validate it.",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Write the records with COPY instead of batched INSERTs; always used when the table is empty.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Index every file, including files whose size and modification time are unchanged since the last run.",
+    )
+    parser.add_argument(
+        "--log-file",
+        default=LOG_FILE,
+        help=f"File the parse and write errors are appended to. Default is '{LOG_FILE}' in the current directory.",
     )
     args = parser.parse_args()
 
@@ -254,4 +682,4 @@ if __name__ == "__main__":
     if not Path(scan_directory).is_dir():
         print(f"Error: Directory '{scan_directory}' not found.")
     else:
-        run_indexer(str(scan_directory), max_workers=args.workers)
\ No newline at end of file
+        run_indexer(str(scan_directory), max_workers=args.workers, astropy_altitudes=args.astropy_altitudes, force=args.force, bulk=args.bulk, log_file=args.log_file)
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# The modules live in the repository root and database.py builds its engine on import;
+# it does not connect until used, so placeholder settings suffice for tests without a database
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+for name, value in {'DB_USER': 'postgres', 'DB_PASSWORD': '', 'DB_HOST': 'localhost', 'DB_PORT': '5432', 'DB_NAME': 'fitsdb'}.items():
+    os.environ.setdefault(name, value)
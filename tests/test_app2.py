@@ -0,0 +1,82 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from streamlit.testing.v1 import AppTest
+
+from export_data import header_column
+
+APP_PATH = str(Path(__file__).resolve().parent.parent / 'app2.py')
+
+HEADERS = [
+    {'SIMPLE': True, 'BZERO': 32768, 'OBJECT': 'M 31', 'DATE-OBS': '2023-05-21T22:00:00', 'FILTER': None},
+    {'SIMPLE': True, 'OBJECT': 'M 33', 'DATE-OBS': '2023-05-22T23:30:00', 'BZERO': 32768.5},
+]
+
+
+def export_rows():
+    """The fits_files rows of HEADERS, without header_dump."""
+    return pd.DataFrame({
+        'id': [1, 2],
+        'filepath': ['/data/m31.fits', '/data/m33.fits'],
+        'filename': ['m31.fits', 'm33.fits'],
+        'object_name': ['M 31', 'M 33'],
+        'ra_deg': [10.68, 23.46],
+        'dec_deg': [41.27, 30.66],
+        'date_obs': [header['DATE-OBS'] for header in HEADERS],
+        'exptime': [60.0, 120.0],
+        'altitude': [55.0, 62.5],
+        'observatory': ['Home', 'Home'],
+        'scan_root': ['/data', '/data'],
+        'client_hostname': ['pc', 'pc'],
+        'client_os': ['Linux', 'Linux'],
+        'client_mac': ['00:00:00:00:00:01', '00:00:00:00:00:01'],
+    })
+
+
+def write_old_style_export(directory):
+    """Writes a fits_data.parquet like the first export_data.py: date_obs as text, header_dump as JSON."""
+    df = export_rows()
+    df['header_dump'] = [json.dumps(header) for header in HEADERS]
+    df.to_parquet(directory / 'fits_data.parquet', index=False, version='1.0')
+
+
+def write_export(directory):
+    """Writes a fits_data.parquet with the types export_data.py writes: timestamps and typed header cards."""
+    df = export_rows()
+    df['date_obs'] = pd.to_datetime(df['date_obs'])
+    table = pa.Table.from_pandas(df, preserve_index=False).append_column('header_dump', header_column(HEADERS))
+    pq.write_table(table, directory / 'fits_data.parquet')
+
+
+def inspected_headers(directory, monkeypatch):
+    """Selects every file in the app's header inspector and returns the headers it shows."""
+    monkeypatch.chdir(directory)
+    at = AppTest.from_file(APP_PATH, default_timeout=60).run()
+    assert not at.exception
+
+    headers = []
+    selectbox = at.selectbox(key='selected_file')
+    for filepath in ['/data/m31.fits', '/data/m33.fits']:
+        selectbox.set_value(filepath).run()
+        assert not at.exception
+        headers.extend(json.loads(element.value) for element in at.json)
+    return headers
+
+
+def test_header_inspector_reads_an_old_style_export(tmp_path, monkeypatch):
+    write_old_style_export(tmp_path)
+
+    assert inspected_headers(tmp_path, monkeypatch) == HEADERS
+
+
+def test_header_inspector_shows_the_exported_cards_with_their_types(tmp_path, monkeypatch):
+    write_export(tmp_path)
+
+    headers = inspected_headers(tmp_path, monkeypatch)
+
+    assert headers == HEADERS
+    assert [list(header.items()) for header in headers] == [list(header.items()) for header in HEADERS]
+    assert [type(header['BZERO']) for header in headers] == [int, float]
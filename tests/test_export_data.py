@@ -0,0 +1,40 @@
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from export_data import header_column
+from fitsdb import decode_header
+
+
+def read_back(column, tmp_path):
+    path = tmp_path / 'headers.parquet'
+    pq.write_table(pa.table({'header_dump': column}), path)
+    return [None if cards is None else decode_header(cards) for cards in pq.read_table(path).column('header_dump').to_pylist()]
+
+
+def test_header_column_round_trips_header_dump(tmp_path):
+    header_dumps = [
+        {'SIMPLE': True, 'BZERO': 32768, 'OBJECT': 'M 31', 'FILTER': None, 'COMMENT': 'first file', 'EMPTY': ''},
+        {'SIMPLE': True, 'OBJECT': 'M 33', 'BZERO': 32768.5, 'EXPTIME': 0.0, 'FLIPPED': False, 'NAXIS': 0},
+        # header_dump values that were JSON-encoded twice are stored once
+        json.dumps(json.dumps({'SIMPLE': True, 'NAXIS': 2})),
+    ]
+
+    headers = read_back(header_column(header_dumps), tmp_path)
+
+    expected = header_dumps[:2] + [{'SIMPLE': True, 'NAXIS': 2}]
+    assert headers == expected
+    for header, original in zip(headers, expected):
+        assert list(header) == list(original)
+        assert [type(value) for value in header.values()] == [type(value) for value in original.values()]
+
+
+def test_header_column_keeps_integers_wider_than_int64_as_text(tmp_path):
+    assert read_back(header_column([{'BIG': 2**64}]), tmp_path) == [{'BIG': str(2**64)}]
+
+
+def test_header_column_exports_a_header_that_is_not_json_as_null(tmp_path):
+    column = header_column([{'OBJECT': 'M 31'}, 'OBJECT = M 33, not JSON'])
+
+    assert read_back(column, tmp_path) == [{'OBJECT': 'M 31'}, None]
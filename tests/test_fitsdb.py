@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from fitsdb import count_nights
+
+
+@pytest.mark.parametrize('date_obs, nights', [
+    (['2023-05-21T22:00:00', '2023-05-21T23:30:00', '2023-05-22T01:15:00'], 2),
+    (['2023-05-21T22:00:00', 'NaT', '2023-05-22T01:15:00', 'NaT'], 2),
+    (['NaT', 'NaT'], 0),
+    ([], 0),
+])
+def test_count_nights_ignores_missing_date_obs(date_obs, nights):
+    assert count_nights(np.array(date_obs, dtype='datetime64[ns]')) == nights
@@ -0,0 +1,219 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from astropy.io import fits
+from astropy.time import Time
+
+import indexer
+from database import json_serializer
+from indexer import (
+    altitudes_astropy, altitudes_erfa, calculate_altitudes, copy_value, extract_and_convert_coords, find_files,
+    parse_header_cards, parse_sexagesimal, unique_records,
+)
+
+
+def test_find_files_drops_symlinks_to_the_same_file(tmp_path):
+    target = tmp_path / 'light.fits'
+    target.write_bytes(b'')
+    os.symlink(target, tmp_path / 'link1.fits')
+    os.symlink(target, tmp_path / 'link2.fits')
+
+    files = find_files(str(tmp_path), ('.fits',))
+
+    assert [path for path, _, _ in files] == [target.resolve()]
+
+
+def test_unique_records_keeps_the_last_record_per_filepath():
+    records = [
+        {'filepath': '/data/a.fits', 'object_name': 'M 31'},
+        {'filepath': '/data/b.fits', 'object_name': 'M 33'},
+        {'filepath': '/data/a.fits', 'object_name': 'M 101'},
+    ]
+
+    assert unique_records(records) == [
+        {'filepath': '/data/a.fits', 'object_name': 'M 101'},
+        {'filepath': '/data/b.fits', 'object_name': 'M 33'},
+    ]
+
+
+def test_calculate_altitudes_leaves_a_failing_site_empty(monkeypatch):
+    site_ok, site_failing = (48.129, 16.024, 940.0), (-30.0, 70.0, 2000.0)
+    observations = [
+        (83.8, -5.4, 2460000.5, 0.1, site_ok),
+        (83.8, -5.4, 2460000.5, 0.1, site_failing),
+        None,
+    ]
+    altitudes_erfa = indexer.altitudes_erfa
+
+    def failing_for_one_site(ra_deg, dec_deg, time, site_lat, site_lon):
+        if site_lat == site_failing[0]:
+            raise KeyError('simulated IERS failure')
+        return altitudes_erfa(ra_deg, dec_deg, time, site_lat, site_lon)
+
+    monkeypatch.setattr(indexer, 'altitudes_erfa', failing_for_one_site)
+
+    altitudes = calculate_altitudes(observations)
+
+    assert isinstance(altitudes[0], float)
+    assert altitudes[1:] == [None, None]
+
+
+def header_blocks(*cards: str, encoding: str = 'ascii') -> bytes:
+    """Builds the blocks of a primary header from card images, as read_header_bytes returns them."""
+    text = ''.join(card.ljust(80) for card in ('SIMPLE  =                    T', *cards, 'END'))
+    return text.ljust(-(-len(text) // 2880) * 2880).encode(encoding)
+
+
+@pytest.mark.parametrize('card, expected', [
+    ("OBJECT  = 'M 31'             / target", 'M 31'),
+    ("OBSERVER= 'O''Brien  '", "O'Brien"),
+    ("FILTER  = '  Ha'", '  Ha'),
+    ("EMPTY   = '    '", ''),
+    ("NONE    = ''                 / empty string", ''),
+    ("PATH    = 'a/b'              / c/d", 'a/b'),
+    ("FLIPPED =                    F", False),
+    ("FLAG    = T/no space before the comment", True),
+    ("NAXIS1  =                 6224", 6224),
+    ("OFFSET  = -12", -12),
+    ("GAIN    = +7", 7),
+    ("WIDE    = 12345678901234567890", 12345678901234567890),
+    ("EXPTIME =                  60.", 60.0),
+    ("SCALE   = 1.5D3", 1500.0),
+    ("SCALE2  = 1.5d3", 1500.0),
+    ("XPIXSZ  = .5E2", 50.0),
+    ("CCD-TEMP= -.5", -0.5),
+    ("ZERO    = 0.0E000", 0.0),
+    ("HUGE    = 1e999", float('inf')),
+    ("REAL    = 1.0e+5/comment", 100000.0),
+    ("BLANK   =                      / undefined value", None),
+    ("COMMENT   commentary text  ", '  commentary text'),
+    ("HISTORY x", 'x'),
+    ("        blank keyword", 'blank keyword'),
+])
+def test_parse_header_cards_matches_astropy(card, expected):
+    data = header_blocks(card)
+
+    cards = parse_header_cards(data)
+
+    assert cards == dict(fits.Header.fromstring(data).items())
+    value = list(cards.values())[-1]
+    assert value == expected and type(value) is type(expected)
+
+
+def test_parse_header_cards_keeps_the_last_of_repeated_commentary_cards():
+    data = header_blocks('COMMENT first', 'OBJECT  = ' + "'M 31'", 'COMMENT second')
+
+    cards = parse_header_cards(data)
+
+    assert cards == dict(fits.Header.fromstring(data).items())
+    assert list(cards) == ['SIMPLE', 'COMMENT', 'OBJECT'] and cards['COMMENT'] == 'second'
+
+
+@pytest.mark.parametrize('cards', [
+    ['HIERARCH ESO DET TEMP = 5'],
+    ["LONG    = 'first part&'", "CONTINUE  'second part'"],
+    ["OBJECT  = 'M 31'", "OBJECT  = 'M 33'"],
+    ['lower   = 5'],
+    ['NOVALUE     = 5'],
+    ['TIGHT   =5'],
+    ['COMPLEX = (1, 2)'],
+    ['SPLIT   = 1.5 2'],
+    ["JUNK    = 'x' junk"],
+    ["OPEN    = 'unterminated"],
+    ['EXP     = 1.5E+'],
+])
+def test_parse_header_cards_leaves_other_cards_to_astropy(cards):
+    assert parse_header_cards(header_blocks(*cards)) is None
+
+
+def test_parse_header_cards_leaves_non_ascii_headers_to_astropy():
+    assert parse_header_cards(header_blocks("OBSERVER= 'Jürgen'", encoding='latin-1')) is None
+    assert parse_header_cards(header_blocks("NOTE    = 'tab\there'")) is None
+
+
+# Documented accuracy of altitudes_erfa against the full AltAz transform
+ERFA_ALTITUDE_TOLERANCE_DEG = 0.01
+
+
+@pytest.mark.parametrize('site_lat, site_lon, site_height', [
+    (48.129, 16.024, 940.0),  # DEFAULT_LOCATION
+    (-30.24, -70.74, 2200.0),
+    (19.82, -155.47, 4200.0),
+    (78.2, 15.6, 10.0),
+])
+def test_altitudes_erfa_matches_astropy(site_lat, site_lon, site_height):
+    rng = np.random.default_rng(0)
+    ra_deg = rng.uniform(0, 360, 200)
+    dec_deg = np.concatenate([[-89.0, -45.0, 0.0, 45.0, 89.0], rng.uniform(-89, 89, 195)])
+    time = Time(rng.uniform(Time('2005-01-01').jd, Time('2025-01-01').jd, 200), format='jd', scale='utc')
+
+    erfa_altitudes = altitudes_erfa(ra_deg, dec_deg, time, site_lat, site_lon)
+    astropy_altitudes = altitudes_astropy(ra_deg, dec_deg, time, site_lat, site_lon, site_height)
+
+    np.testing.assert_allclose(erfa_altitudes, astropy_altitudes, rtol=0, atol=ERFA_ALTITUDE_TOLERANCE_DEG)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, r'\N'),
+    # A literal \N string must not read back as NULL
+    (r'\N', r'\\N'),
+    ('C:\\images\\M 31.fits', 'C:\\\\images\\\\M 31.fits'),
+    ('tab\there', 'tab\\there'),
+    ('line\nbreak', 'line\\nbreak'),
+    ('carriage\rreturn', 'carriage\\rreturn'),
+    (True, 'True'),
+    (42, '42'),
+    (60.5, '60.5'),
+    (datetime(2023, 5, 21, 22, 0, 0, 123000), '2023-05-21 22:00:00.123000'),
+])
+def test_copy_value_formats_copy_text_fields(value, expected):
+    assert copy_value(value) == expected
+
+
+def test_copy_value_serializes_and_escapes_jsonb_dicts():
+    header = {'OBJECT': 'M 31', 'NOTE': 'say "hi"\tnow', 'PATH': 'C:\\data', 'BLANK': None, 'FLIPPED': False}
+
+    field = copy_value(header)
+
+    # No raw separators or line breaks survive, and unescaping gives back the JSON of the dict
+    assert '\t' not in field and '\n' not in field and '\r' not in field
+    unescaped = field.replace('\\\\', '\0').replace('\\t', '\t').replace('\\n', '\n').replace('\\r', '\r').replace('\0', '\\')
+    assert unescaped == json_serializer(header)
+    assert json.loads(unescaped) == header
+
+
+@pytest.mark.parametrize('ra, dec', [
+    ('05 35 17.3', '-05 23 28'),
+    ('05:35:17.3', '-05:23:28'),
+    ('00 42 44.3', '-00 30 00'),
+    ('23 59 59.99', '+89 59 59'),
+    ('12 30 45.', '+45:00:00.5'),
+    ('  13 29 52.7 ', '47 11 43'),
+])
+def test_parse_sexagesimal_matches_skycoord(ra, dec):
+    coords = SkyCoord(ra, dec, unit=(u.hourangle, u.deg), frame='icrs')
+
+    assert parse_sexagesimal(ra) * 15 % 360 == pytest.approx(coords.ra.deg, abs=1e-9)
+    assert parse_sexagesimal(dec) == pytest.approx(coords.dec.deg, abs=1e-9)
+
+
+def test_parse_sexagesimal_keeps_the_sign_of_a_zero_degree_field():
+    assert parse_sexagesimal('-00 30 00') == -0.5
+    assert parse_sexagesimal('+00 30 00') == 0.5
+
+
+@pytest.mark.parametrize('value', ['12 60 00', '12 30 60', '12 30 75.5', '210.8', '12h30m45s', '12 30', '', 12.5, None])
+def test_parse_sexagesimal_rejects_other_values(value):
+    assert parse_sexagesimal(value) is None
+
+
+def test_extract_and_convert_coords_falls_back_to_skycoord_for_other_values():
+    header = {'RA': 12.5, 'DEC': 45.25}
+    coords = SkyCoord('12.5', '45.25', unit=(u.hourangle, u.deg), frame='icrs')
+
+    assert extract_and_convert_coords(header) == pytest.approx((coords.ra.deg, coords.dec.deg))